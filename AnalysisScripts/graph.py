@@ -1,116 +1,145 @@
 # Graph analysis of experiment log
+# Usage: python3 graph.py <log> [show] [--filtered minmax|lttb|none] [--raw ...] [--points N]
+# (many logs at once: report.py)
+import os
 import sys
+import argparse
 import numpy as np
 from matplotlib import pyplot as plt
-from OneEuroFilter import OneEuroFilter
-
-file = sys.argv[1]
-try:
-    SHOW = False if sys.argv[2] in ["0", "False", "FALSE", "false"] else True
-except IndexError:
-    SHOW = True
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import batch
+from downsample import downsample, METHODS
+from sessionlog import load_session, EVENT_PHASE
 
 euroFilterConfig = {
         'freq': 100,       # Hz
         'mincutoff': 1.0,  # Hz
-        'beta': 0.1,       
-        'dcutoff': 1.0    
+        'beta': 0.1,
+        'dcutoff': 1.0
         }
-filter = OneEuroFilter(**euroFilterConfig)
-
-data = []
-raw = []
-total_data_count = 0
-calibration = True
-cal_total = 0
-cal_avg = 0
-npavg = 0 # None
-detection_times = []
-
-with open(file, "r") as f:
-    for line in f.readlines():
-        try:
-            value = float(line)
-            raw.append(value)
-            total_data_count += 1
-            filtered_value = filter(value, 0.01 * total_data_count)
-            data.append(filtered_value)
-            if calibration:
-                cal_total += filtered_value
-                cal_avg = cal_total / total_data_count
-        except ValueError:
-            print(line)
-            if line.strip() == "Phases.RUNNING":
-                print("End of calibration")
-                print("NOW: ", total_data_count)
-                print("in sec ", 0.01 * total_data_count)
-                calibration = False
-                npavg = np.mean(data)
-            elif line.strip() == "Phases.DETECTED":
-                print("NOW: ", total_data_count)
-                print("in sec ", 0.01 * total_data_count)
-                detection_times.append(0.01 * total_data_count) 
-            continue
-
-print("AVG: ", cal_avg)
-print("NP AVG: ", npavg)
-
-time_in_ms = np.arange(0, 60*60*1000, 10)  # X min in milliseconds (10ms interval)
-time_in_ms = time_in_ms[:len(data)]
-time_in_minutes = time_in_ms / (1000 * 60)
-final_min = time_in_minutes[-1]
-
-
-max_index = np.argmax(data[:-120]) # Ignoring end spike
-max_time_in_minutes = time_in_minutes[max_index]
-
-print("Index where data is maximum:", max_index)
-print("Corresponding time_in_ms value:", time_in_ms[max_index])
-print("Time in minutes where data is maximum:", max_time_in_minutes)
-plt.axvline(x=max_time_in_minutes, color='red', linestyle='--', label='Max Data Location')
-
-# Set x-axis ticks every 5 minutes
-plt.xticks(np.arange(0, max(time_in_minutes) + 1, 5))
-
-avg = cal_avg
-user = file.split("USERS")[1].split("/")[1]
-
-# FROM TDI code
-sensor_repeatability = 0.02 
-state_change_range = 0.015
-delta_percent = sensor_repeatability + state_change_range
-plt.axhline(y=avg*(1+delta_percent), color='red', linestyle='-.', label='TDI Detection threshold')
-
-detection_legend_added = False
-for detection_tick in detection_times:
-    detection_time_in_minutes = detection_tick / 60 
-    print(detection_time_in_minutes)
-    plt.axvline(x=detection_time_in_minutes, color='purple', linestyle='-.', label='Detection' if not detection_legend_added else '_nolegend_')
-    detection_legend_added = True
-
-plt.xlabel('Time (minutes)')
-plt.ylabel('Voltage')
-plt.axhline(y=avg, color='green', linestyle='--', label='1.5 min calibration average')
-plt.axvline(x=1.5, color='green', linestyle='-', label='Calibration period end')
-plt.axhline(y=avg*(1+sensor_repeatability), color='cyan', linestyle='--', label='+2% sensor repeatability')
-plt.axhline(y=avg*(1+delta_percent), color='black', linestyle='--', label='Delta % state threshold')
-plt.plot(time_in_minutes, data, color='blue', label='Filtered')
-plt.plot(time_in_minutes, raw, color='red', alpha=0.5, label='Raw')
-title = """
-User {0}, 100Hz sampling,
-Filter:'freq':100, 'mincutoff':1.0, 'beta':0.1,'dcutoff':1.0
-""".format(user)
-plt.title(title)
-
-x_point = final_min 
-plt.text(x_point, avg*0.9, 'End', color='black') # Place end marker near end
-
-plt.legend()
-plt.ylim(0.45, 0.75)
-plt.savefig(file + "-User" + user + "-Data.png")
-print(SHOW)
-if SHOW:
-    plt.show()
-plt.close()
-
-
+# Per series, plotted points stay constant whatever the night length
+DOWNSAMPLING = {"filtered": "minmax", "raw": "minmax"}
+PLOT_POINTS = 4000
+TICK_STEPS = [1, 5, 10, 15, 30, 60, 120]  # minutes
+MAX_TICKS = 15
+
+def user_of(file):
+    """ USERS/<id>/... experiment layout, else the file name """
+    if "USERS" in file:
+        return file.split("USERS")[1].split("/")[1]
+    return os.path.basename(file)
+
+def output_path(file):
+    return file + "-User" + user_of(file) + "-Data.png"
+
+def plot_session(file, show=False, verbose=True, downsampling=None, points=PLOT_POINTS):
+    """
+    Renders the data plot of one log next to it, returns the image path
+    downsampling: {"filtered": method, "raw": method}, see downsample.METHODS.
+    Statistics and markers use every sample, only the drawn lines are reduced.
+    """
+    log = print if verbose else (lambda *args: None)
+    downsampling = dict(DOWNSAMPLING, **(downsampling or {}))
+    calibration_end = None
+    calibration_time = 90.0
+    detection_times = []
+
+    # Text or binary log, text logs memory mapped from their .npy sidecar after the first load
+    timestamps, raw, events = load_session(file, mmap=True)
+    start_time = timestamps[0] if len(timestamps) else 0.0
+    for t, index, kind, payload in events:
+        log(payload if kind == EVENT_PHASE else kind + ": " + payload)
+        if kind == EVENT_PHASE and payload == "RUNNING" and calibration_end is None:
+            log("End of calibration")
+            log("NOW: ", index)
+            log("in sec ", t - start_time)
+            calibration_end = index
+            calibration_time = t - start_time
+        elif kind == EVENT_PHASE and payload == "DETECTED":
+            log("NOW: ", index)
+            log("in sec ", t - start_time)
+            detection_times.append(t - start_time)
+
+    # Whole night filtered at once, same values as one filter call per sample
+    data = batch.one_euro_filter(raw, 0.01 * np.arange(1, len(raw) + 1), **euroFilterConfig)
+    if calibration_end is None:
+        calibration_end = len(data)
+    cal_avg = np.cumsum(data[:calibration_end])[-1] / calibration_end if calibration_end else 0
+    npavg = np.mean(data[:calibration_end]) if calibration_end else 0
+
+    log("AVG: ", cal_avg)
+    log("NP AVG: ", npavg)
+
+    # Sample times of the log (every 10 ms for text logs), any night length
+    time_in_ms = (np.asarray(timestamps) - start_time) * 1000
+    time_in_minutes = time_in_ms / (1000 * 60)
+    final_min = time_in_minutes[-1]
+
+    plt.figure()
+    max_index = np.argmax(data[:-120]) # Ignoring end spike
+    max_time_in_minutes = time_in_minutes[max_index]
+
+    log("Index where data is maximum:", max_index)
+    log("Corresponding time_in_ms value:", time_in_ms[max_index])
+    log("Time in minutes where data is maximum:", max_time_in_minutes)
+    plt.axvline(x=max_time_in_minutes, color='red', linestyle='--', label='Max Data Location')
+
+    # Set x-axis ticks every 5 minutes, more for long nights
+    step = next((step for step in TICK_STEPS if final_min / step <= MAX_TICKS), TICK_STEPS[-1])
+    plt.xticks(np.arange(0, final_min + 1, step))
+
+    avg = cal_avg
+    user = user_of(file)
+
+    # FROM TDI code
+    sensor_repeatability = 0.02
+    state_change_range = 0.015
+    delta_percent = sensor_repeatability + state_change_range
+    plt.axhline(y=avg*(1+delta_percent), color='red', linestyle='-.', label='TDI Detection threshold')
+
+    detection_legend_added = False
+    for detection_tick in detection_times:
+        detection_time_in_minutes = detection_tick / 60
+        log(detection_time_in_minutes)
+        plt.axvline(x=detection_time_in_minutes, color='purple', linestyle='-.', label='Detection' if not detection_legend_added else '_nolegend_')
+        detection_legend_added = True
+
+    plt.xlabel('Time (minutes)')
+    plt.ylabel('Voltage')
+    plt.axhline(y=avg, color='green', linestyle='--', label='1.5 min calibration average')
+    plt.axvline(x=calibration_time / 60, color='green', linestyle='-', label='Calibration period end')
+    plt.axhline(y=avg*(1+sensor_repeatability), color='cyan', linestyle='--', label='+2% sensor repeatability')
+    plt.axhline(y=avg*(1+delta_percent), color='black', linestyle='--', label='Delta % state threshold')
+    plt.plot(*downsample(time_in_minutes, data, downsampling["filtered"], points), color='blue', label='Filtered')
+    plt.plot(*downsample(time_in_minutes, raw, downsampling["raw"], points), color='red', alpha=0.5, label='Raw')
+    title = ("\nUser {0}, 100Hz sampling,\n"
+             "Filter:'freq':100, 'mincutoff':1.0, 'beta':0.1,'dcutoff':1.0\n").format(user)
+    plt.title(title)
+
+    x_point = final_min
+    plt.text(x_point, avg*0.9, 'End', color='black') # Place end marker near end
+
+    plt.legend()
+    plt.ylim(0.45, 0.75)
+    output = output_path(file)
+    plt.savefig(output)
+    log(show)
+    if show:
+        plt.show()
+    plt.close()
+    return output
+
+def add_downsampling_arguments(parser):
+    parser.add_argument("--filtered", choices=METHODS, default=DOWNSAMPLING["filtered"])
+    parser.add_argument("--raw", choices=METHODS, default=DOWNSAMPLING["raw"])
+    parser.add_argument("--points", type=int, default=PLOT_POINTS, help="plotted points per series")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Data plot of one experiment log")
+    parser.add_argument("file")
+    parser.add_argument("show", nargs="?", default="1")
+    add_downsampling_arguments(parser)
+    args = parser.parse_args()
+    SHOW = args.show not in ["0", "False", "FALSE", "false"]
+    plot_session(args.file, SHOW, downsampling={"filtered": args.filtered, "raw": args.raw},
+                 points=args.points)
@@ -1,10 +1,10 @@
-python3 graph.py ../../Experiment/USERS/1/Logs/*.datalog 0
-python3 graph.py ../../Experiment/USERS/2/Logs/2023-12-15_15:20:02.402547.datalog 0
-python3 graph.py ../../Experiment/USERS/2/Logs/2023-12-15_15:26:28.473169.datalog 0
-python3 graph.py ../../Experiment/USERS/3/Logs/*.datalog 0
-python3 graph.py ../../Experiment/USERS/4/Logs/*.datalog 0
-python3 graph.py ../../Experiment/USERS/5/Logs/*.datalog 0
-python3 graph.py ../../Experiment/USERS/6/Logs/*.datalog 0
+python3 report.py ../../Experiment/USERS/1/Logs/*.datalog \
+    ../../Experiment/USERS/2/Logs/2023-12-15_15:20:02.402547.datalog \
+    ../../Experiment/USERS/2/Logs/2023-12-15_15:26:28.473169.datalog \
+    ../../Experiment/USERS/3/Logs/*.datalog \
+    ../../Experiment/USERS/4/Logs/*.datalog \
+    ../../Experiment/USERS/5/Logs/*.datalog \
+    ../../Experiment/USERS/6/Logs/*.datalog
 
 mkdir -p ../../Experiment/Graphs
 cp ../../Experiment/USERS/1/Logs/*.png ../../Experiment/Graphs/User1.png
@@ -0,0 +1,75 @@
+# Batch data plots of every session under one or more directories (graph.py)
+# Rendered in parallel worker processes with the non-interactive Agg backend,
+# sessions whose image is newer than both the log and graph.py are skipped.
+# Usage: python3 report.py <dir or log>... [--workers N] [--force] [--filtered/--raw minmax|lttb|none]
+# ex: python3 report.py ../../Experiment/USERS
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+os.environ["MPLBACKEND"] = "Agg"    # Before any matplotlib import, inherited by the workers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import graph
+from catalog import find_files
+from sessionlog import SAMPLES_EXT, is_session_log
+
+def find_sessions(paths):
+    sessions = []
+    for path in paths:
+        if os.path.isdir(path):
+            sessions.extend(found for kind, found, _ in find_files([path]) if kind == "session")
+        else:
+            sessions.append(path)
+    return sessions
+
+def is_stale(session):
+    """ Image missing, older than its log, or older than the plotting code """
+    output = graph.output_path(session)
+    if not os.path.exists(output):
+        return True
+    source = session + SAMPLES_EXT if is_session_log(session) else session
+    newest = max(os.path.getmtime(source), os.path.getmtime(graph.__file__))
+    return os.path.getmtime(output) < newest
+
+def render(session, downsampling, points):
+    """ Worker side, returns (output, seconds) """
+    start = time.perf_counter()
+    output = graph.plot_session(session, show=False, verbose=False, downsampling=downsampling, points=points)
+    return output, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the data plot of every session")
+    parser.add_argument("paths", nargs="+", help="session logs or directories (searched recursively)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="render up to date sessions too")
+    graph.add_downsampling_arguments(parser)
+    args = parser.parse_args()
+    downsampling = {"filtered": args.filtered, "raw": args.raw}
+
+    start = time.perf_counter()
+    sessions = find_sessions(args.paths)
+    todo = [session for session in sessions if args.force or is_stale(session)]
+    print("{0} sessions, {1} to render, {2} up to date, {3} workers".format(
+        len(sessions), len(todo), len(sessions) - len(todo), args.workers))
+    cpu_time = 0.0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(render, session, downsampling, args.points): session for session in todo}
+        for future in as_completed(futures):
+            try:
+                output, seconds = future.result()
+            except Exception as error: # One bad log must not stop the report
+                failed += 1
+                print("Failed {0}: {1}".format(futures[future], error))
+                continue
+            cpu_time += seconds
+            print("{0:6.2f} s  {1}".format(seconds, output))
+    elapsed = time.perf_counter() - start
+    print("Rendered {0}, failed {1}, skipped {2} in {3:.1f} s ({4:.1f} s of rendering)".format(
+        len(todo) - failed, failed, len(sessions) - len(todo), elapsed, cpu_time))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+# Detector parameter sweep over recorded sessions
+# Usage: python3 sweep.py <log or dir>... [--param name=v1,v2,...]... [--random N] [--workers N]
+# ex: python3 sweep.py ../LOGS --param sensor_repeatability=0.01,0.02,0.03 --param stable_window=5,10
+import os
+import sys
+import time
+import json
+import random
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import batch
+from replay import FILTER_CONFIG, CALIBRATION_PERIOD, PROTOCOL_DURATION, WINDOW_VALUES
+from catalog import find_files
+from sessionlog import load_session, EVENT_PHASE, SAMPLES_EXT
+
+# Defaults are the values hard-coded in TDI
+DETECTOR_PARAMS = {
+        'sensor_repeatability': 0.02,
+        'state_change_range': 0.015,
+        'stable_window': 10,
+        'grace_window': 10,
+        'calibration_period': CALIBRATION_PERIOD,
+        }
+FILTER_PARAMS = {key: value for key, value in FILTER_CONFIG.items() if key != 'freq'}
+CACHE_DIR = ".sweep_cache"
+
+#----------------------------------------
+def find_sessions(paths):
+    sessions = []
+    for path in paths:
+        if os.path.isdir(path):    # Same discovery as the catalog, checkpoints and sidecars skipped
+            sessions.extend(found for kind, found, _ in find_files([path]) if kind == "session")
+        else:
+            sessions.append(path)
+    return sessions
+
+def _key(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+def _source_stamp(session):
+    path = session + SAMPLES_EXT if os.path.exists(session + SAMPLES_EXT) else session
+    stat = os.stat(path)
+    return os.path.abspath(session), stat.st_mtime_ns, stat.st_size
+
+def _atomic_save(cache_file, save, *args, **kwargs):
+    # Several workers can build the same entry, last complete write wins
+    temp_file = "{0}.{1}.tmp".format(cache_file, os.getpid())
+    with open(temp_file, "wb") as f:
+        save(f, *args, **kwargs)
+    os.replace(temp_file, cache_file)
+
+def load_logged_session(session):
+    """ Samples and logged detection times, text logs memory mapped from their sidecar """
+    timestamps, values, events = load_session(session, mmap=True)
+    start_time = timestamps[0] if len(timestamps) else 0.0
+    logged = np.array([t - start_time for t, _, kind, payload in events
+                       if kind == EVENT_PHASE and payload == "DETECTED"])
+    return timestamps, values, logged
+
+def load_cached_filtered(session, values, filter_config, cache_dir):
+    """ Filtered signal cached per filter config, detector changes never re-filter """
+    config = tuple(sorted(filter_config.items()))
+    cache_file = os.path.join(cache_dir, _key(_source_stamp(session), config) + ".npy")
+    if os.path.exists(cache_file):
+        return np.load(cache_file, mmap_mode='r')
+    filtered = batch.filter_session(values, filter_config)
+    _atomic_save(cache_file, np.save, filtered)
+    return filtered
+
+def detection_offsets(detections, logged):
+    """ Replayed minus logged time, for each logged detection its nearest replay """
+    if len(detections) == 0 or len(logged) == 0:
+        return []
+    detections = np.asarray(detections)
+    return [float(detections[np.argmin(np.abs(detections - t))] - t) for t in logged]
+
+def run_group(session, filter_config, detector_configs, cache_dir):
+    """ One session, one filter config, all detector configs (worker process) """
+    timestamps, values, logged = load_logged_session(session)
+    start = time.perf_counter()
+    filtered = load_cached_filtered(session, values, filter_config, cache_dir)
+    filter_time = time.perf_counter() - start
+    results = []
+    for detector_config in detector_configs:
+        config = dict(detector_config)
+        calibration_period = config.pop('calibration_period')
+        start = time.perf_counter()
+        result = batch.run_session(values, timestamps, filter_config, config, WINDOW_VALUES,
+                                   calibration_period, PROTOCOL_DURATION, filtered=filtered)
+        results.append({
+                "detections": result["detections"],
+                "offsets": detection_offsets(result["detections"], logged),
+                "logged": len(logged),
+                "time": time.perf_counter() - start,
+                })
+    return session, filter_config, filter_time, results
+
+#----------------------------------------
+def parse_params(specs):
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in DETECTOR_PARAMS and name not in FILTER_PARAMS:
+            raise ValueError("Unknown parameter {0}, choose from {1}".format(
+                name, sorted(DETECTOR_PARAMS) + sorted(FILTER_PARAMS)))
+        grid[name] = [float(value) for value in values.split(",")]
+    return grid
+
+def build_configs(grid, n_random=0, seed=0):
+    """ Full grid, or n_random uniform draws between each parameter's min and max """
+    defaults = dict(DETECTOR_PARAMS, **FILTER_PARAMS)
+    names = sorted(grid)
+    if n_random:
+        rng = random.Random(seed)
+        points = [[rng.uniform(min(grid[name]), max(grid[name])) for name in names]
+                  for _ in range(n_random)]
+    else:
+        points = itertools.product(*[grid[name] for name in names])
+    configs = []
+    for point in points:
+        config = dict(defaults, **dict(zip(names, point)))
+        filter_config = dict(FILTER_CONFIG, **{name: config[name] for name in FILTER_PARAMS})
+        detector_config = {name: config[name] for name in DETECTOR_PARAMS}
+        configs.append((filter_config, detector_config))
+    return configs
+
+def summarize(configs, outputs):
+    rows = []
+    for index, (filter_config, detector_config) in enumerate(configs):
+        per_session = [results[index] for results in outputs]
+        offsets = [offset for result in per_session for offset in result["offsets"]]
+        rows.append({
+                "filter": filter_config,
+                "detector": detector_config,
+                "detections": sum(len(result["detections"]) for result in per_session),
+                "logged": sum(result["logged"] for result in per_session),
+                "sessions_detected": sum(1 for result in per_session if result["detections"]),
+                "mean_abs_offset": float(np.mean(np.abs(offsets))) if offsets else None,
+                "mean_offset": float(np.mean(offsets)) if offsets else None,
+                "time": sum(result["time"] for result in per_session),
+                })
+    return rows
+
+def print_rows(rows, names, n_sessions):
+    header = names + ["detections", "logged", "sessions", "|offset| s", "offset s", "time ms"]
+    print(" ".join("{0:>12}".format(column[:12]) for column in header))
+    for row in rows:
+        config = dict(row["detector"], **row["filter"])
+        cells = ["{0:12.4g}".format(config[name]) for name in names]
+        cells += ["{0:12d}".format(row["detections"]), "{0:12d}".format(row["logged"]),
+                  "{0:>12}".format("{0}/{1}".format(row["sessions_detected"], n_sessions)),
+                  "{0:12.1f}".format(row["mean_abs_offset"]) if row["mean_abs_offset"] is not None else "{0:>12}".format("-"),
+                  "{0:12.1f}".format(row["mean_offset"]) if row["mean_offset"] is not None else "{0:>12}".format("-"),
+                  "{0:12.2f}".format(1000 * row["time"])]
+        print(" ".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Detector parameter sweep over session logs")
+    parser.add_argument("sessions", nargs="+", help="session logs or directories of logs")
+    parser.add_argument("--param", action="append", default=[], help="name=v1,v2,... (repeatable)")
+    parser.add_argument("--random", type=int, default=0, help="N random configs within the param ranges")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--sort", default="mean_abs_offset", help="result column to sort by")
+    parser.add_argument("--json", help="write all results to this file")
+    args = parser.parse_args()
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    sessions = find_sessions(args.sessions)
+    grid = parse_params(args.param)
+    configs = build_configs(grid, args.random, args.seed)
+    # Group by filter config so each session is filtered once per filter config
+    groups = {}
+    for index, (filter_config, detector_config) in enumerate(configs):
+        groups.setdefault(tuple(sorted(filter_config.items())), []).append(index)
+    print("{0} sessions, {1} configs ({2} filter configs), {3} workers".format(
+        len(sessions), len(configs), len(groups), args.workers))
+
+    start = time.perf_counter()
+    outputs = {session: [None] * len(configs) for session in sessions}
+    filter_time = 0.0
+    # Kernels compiled in each worker first, the first config of a worker is timed like the others
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=batch.warm_up) as pool:
+        futures = {}
+        for key, indices in groups.items():
+            detector_configs = [configs[index][1] for index in indices]
+            for session in sessions:
+                future = pool.submit(run_group, session, dict(key), detector_configs, args.cache_dir)
+                futures[future] = indices
+        for future, indices in futures.items():
+            session, _, group_filter_time, results = future.result()
+            filter_time += group_filter_time
+            for index, result in zip(indices, results):
+                outputs[session][index] = result
+    elapsed = time.perf_counter() - start
+
+    rows = summarize(configs, list(outputs.values()))
+    rows.sort(key=lambda row: (row[args.sort] is None, row[args.sort]))
+    print_rows(rows, sorted(grid) or ["sensor_repeatability"], len(sessions))
+    print("Total {0:.2f} s (filtering {1:.2f} s cpu), {2:.1f} ms per config".format(
+        elapsed, filter_time, 1000 * elapsed / max(len(configs), 1)))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=1)
+
+if __name__ == '__main__':
+    main()
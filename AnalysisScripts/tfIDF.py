@@ -1,64 +1,283 @@
-import sys
+# TF-IDF of dream reports (paragraph 1: pre, paragraph 2: post) kept in a persisted index
+# Each run only tokenizes new or changed report files, scores come from stored counts.
+# Usage: python3 tfIDF.py <file_path1> <file_path2> ... [--index DIR] [--control P1,P2]
+#        [--by phase|condition|participant|document] [--top N] [--prune] [--all]
+# ex: python3 tfIDF.py USERS/1/text USERS/2/text --control 2 --by condition
+import os
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from nltk.corpus import stopwords
+import sys
+import json
+import argparse
+
+import numpy as np
+
+INDEX_DIR = ".tfidf_index"
+PHASES = ["pre", "post"]
+# Treating appostrophes correctly
+TOKEN = re.compile(r"\b[a-zA-Z0-9]+(?:'\w+)?\b")
 
 def read_text_from_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
-        paragraphs = file.read().split('\n\n')  # Split paragraphs by empty lines 
+        paragraphs = file.read().split('\n\n')  # Split paragraphs by empty lines
     return paragraphs
 
 def custom_tokenizer(text):
-    # Treating appostrophes correctly
-    return re.findall(r"\b[a-zA-Z0-9]+(?:'\w+)?\b", text)
-
-def perform_tfidf(texts):
-    final_stopwords_list = stopwords.words('english') + stopwords.words('french')
-    vectorizer = TfidfVectorizer(tokenizer=custom_tokenizer, stop_words=final_stopwords_list)
-    tfidf_matrix = vectorizer.fit_transform(texts)
-    feature_names = vectorizer.get_feature_names_out()
-    results = {}
-    for i, text in enumerate(texts):
-        feature_index = tfidf_matrix[i, :].nonzero()[1]
-        tfidf_scores = zip(feature_index, [tfidf_matrix[i, x] for x in feature_index])
-        tfidf_values = {feature_names[i]: score for i, score in tfidf_scores}
-        # Sort the terms by TF-IDF score in descending order
-        sorted_tfidf_values = {k: v for k, v in sorted(tfidf_values.items(), key=lambda item: item[1], reverse=True)}
-        results[f"Text {i + 1}"] = sorted_tfidf_values
-    return results
+    return TOKEN.findall(text)
+
+def participant_of(file_path):
+    """ <root>/<participant>/text layout of runTFIDF.sh """
+    return os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+
+def signature(file_path):
+    stat = os.stat(file_path)
+    return "{0}:{1}".format(stat.st_size, stat.st_mtime_ns)
+
+def tfidf(vectors, n_terms):
+    """
+    Same scores as sklearn TfidfVectorizer defaults (smooth idf, l2 norm)
+    fitted on these documents, vectors as (term ids, counts)
+    """
+    df = np.zeros(n_terms)
+    for ids, _ in vectors:
+        df[ids] += 1
+    idf = np.log((1 + len(vectors)) / (1 + df)) + 1
+    scores = []
+    for ids, counts in vectors:
+        weights = counts * idf[ids]
+        norm = np.sqrt(np.sum(weights ** 2))
+        scores.append(weights / norm if norm else weights)
+    return scores
+
+class TfidfIndex:
+    """
+    <dir>/meta.json     vocabulary, stop words, documents (source file, signature, groups)
+    <dir>/df.npy        document frequency per term
+    <dir>/docs/N.npz    term ids and counts of one document (sparse)
+    <dir>/groups/G.npz  summed counts of a group (pre, post, control, main, one participant)
+    Adding a report touches its own rows, the groups it belongs to and the vocabulary.
+    """
+    def __init__(self, directory=INDEX_DIR):
+        self.directory = directory
+        meta_file = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_file):
+            with open(meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.df = np.load(os.path.join(directory, "df.npy"))
+        else:
+            meta = {"vocab": [], "stopwords": self._stopwords(), "docs": {}, "next_row": 0}
+            self.df = np.zeros(0, dtype=np.int64)
+        self.vocab = meta["vocab"]
+        self.term_ids = {term: index for index, term in enumerate(self.vocab)}
+        self.stopwords = set(meta["stopwords"])
+        self.docs = meta["docs"]
+        self.next_row = meta["next_row"]
+        self._groups = {}   # Loaded or changed group vectors, dense
+        os.makedirs(os.path.join(directory, "docs"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "groups"), exist_ok=True)
+
+    @staticmethod
+    def _stopwords():
+        """ Built once when the index is created, then read from meta.json """
+        from nltk.corpus import stopwords
+        return sorted(set(stopwords.words('english') + stopwords.words('french')))
+
+    def tokenize(self, text):
+        # Same as the TfidfVectorizer: lowercase, custom tokenizer, stop words removed
+        return [token for token in custom_tokenizer(text.lower()) if token not in self.stopwords]
+
+    #------------------------------
+    def _row_file(self, row):
+        return os.path.join(self.directory, "docs", "{0}.npz".format(row))
+
+    def _group_file(self, group):
+        return os.path.join(self.directory, "groups", group.replace(os.sep, "_") + ".npz")
+
+    def load_vector(self, path):
+        with np.load(path) as stored:
+            return stored["ids"], stored["counts"]
+
+    def group(self, group):
+        """ Dense counts of a group, vocabulary sized """
+        if group not in self._groups:
+            dense = np.zeros(len(self.vocab))
+            if os.path.exists(self._group_file(group)):
+                ids, counts = self.load_vector(self._group_file(group))
+                dense[ids] = counts
+            self._groups[group] = dense
+        elif len(self._groups[group]) < len(self.vocab):
+            self._groups[group] = np.concatenate((self._groups[group],
+                                                  np.zeros(len(self.vocab) - len(self._groups[group]))))
+        return self._groups[group]
+
+    def _add_to_groups(self, doc, ids, counts, sign):
+        for group in self.groups_of(doc):
+            self.group(group)[ids] += sign * counts
+
+    @staticmethod
+    def groups_of(doc):
+        return ["phase=" + doc["phase"], "condition=" + doc["condition"], "participant=" + doc["participant"]]
+
+    #------------------------------
+    def add_document(self, key, text, source, participant, phase, condition):
+        if key in self.docs:
+            self.remove_document(key)
+        terms, counts = np.unique(self.tokenize(text), return_counts=True)
+        for term in terms:
+            if term not in self.term_ids:
+                self.term_ids[term] = len(self.vocab)
+                self.vocab.append(term)
+        if len(self.df) < len(self.vocab):
+            self.df = np.concatenate((self.df, np.zeros(len(self.vocab) - len(self.df), dtype=np.int64)))
+        ids = np.array([self.term_ids[term] for term in terms], dtype=np.int64)
+        counts = counts.astype(np.float64)
+        self.df[ids] += 1
+        doc = {"source": source, "signature": signature(source), "participant": participant,
+               "phase": phase, "condition": condition, "row": self.next_row}
+        self.next_row += 1
+        np.savez(self._row_file(doc["row"]), ids=ids, counts=counts)
+        self.docs[key] = doc
+        self._add_to_groups(doc, ids, counts, 1)
+
+    def remove_document(self, key):
+        doc = self.docs.pop(key)
+        ids, counts = self.load_vector(self._row_file(doc["row"]))
+        self.df[ids] -= 1
+        self._add_to_groups(doc, ids, counts, -1)
+        os.remove(self._row_file(doc["row"]))
+
+    def set_condition(self, key, condition):
+        doc = self.docs[key]
+        if doc["condition"] != condition:
+            ids, counts = self.load_vector(self._row_file(doc["row"]))
+            self._add_to_groups(doc, ids, counts, -1)
+            doc["condition"] = condition
+            self._add_to_groups(doc, ids, counts, 1)
+
+    def update_file(self, file_path, control=()):
+        """ Returns True when the file was (re)tokenized """
+        file_path = os.path.abspath(file_path)  # One document whatever the path spelling
+        participant = participant_of(file_path)
+        condition = "control" if participant in control else "main"
+        keys = self.keys_of(file_path)
+        current = signature(file_path)
+        # A report with a single paragraph only has its "pre" document
+        if keys and all(self.docs[key]["signature"] == current for key in keys):
+            for key in keys:
+                self.set_condition(key, condition)
+            return False
+        for key in keys:
+            self.remove_document(key)
+        paragraphs = read_text_from_file(file_path)
+        for phase, paragraph in zip(PHASES, paragraphs):
+            self.add_document(file_path + "#" + phase, paragraph.strip(), file_path, participant, phase, condition)
+        return True
+
+    def keys_of(self, file_path):
+        """ Indexed documents of a report file (absolute path) """
+        return [key for key in (file_path + "#" + phase for phase in PHASES) if key in self.docs]
+
+    def prune(self):
+        """ Drop documents of deleted report files """
+        missing = [key for key, doc in self.docs.items() if not os.path.exists(doc["source"])]
+        for key in missing:
+            self.remove_document(key)
+        return len(missing)
+
+    def save(self):
+        np.save(os.path.join(self.directory, "df.npy"), self.df)
+        for group, dense in self._groups.items():
+            ids = np.flatnonzero(dense)
+            np.savez(self._group_file(group), ids=ids, counts=dense[ids])
+        meta = {"vocab": self.vocab, "stopwords": sorted(self.stopwords), "docs": self.docs,
+                "next_row": self.next_row}
+        temp_file = os.path.join(self.directory, "meta.json.tmp")
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp_file, os.path.join(self.directory, "meta.json"))  # Last, commits the update
+
+    #------------------------------
+    def _ranked(self, ids, scores, top):
+        order = sorted(range(len(ids)), key=lambda i: (-scores[i], self.vocab[ids[i]]))
+        return {self.vocab[ids[i]]: float(scores[i]) for i in order[:top] if scores[i] > 0}
+
+    def top_terms_by(self, by, top=None, keys=None):
+        """
+        {name: {term: score}} with the compared documents as the corpus:
+        by phase/condition/participant compares the summed groups (the
+        original pre vs post analysis is by="phase"), by document uses the
+        document frequencies of the scored documents.
+        keys: documents scored, default every indexed one (stored groups and
+        df, nothing loaded); a subset is summed from its document rows.
+        """
+        if keys is None or set(keys) >= set(self.docs):
+            docs = self.docs
+        else:
+            docs = {key: self.docs[key] for key in keys}
+        rows = None
+        if docs is not self.docs:
+            rows = {key: self.load_vector(self._row_file(doc["row"])) for key, doc in docs.items()}
+        if by == "document":
+            df = self.df
+            if rows is not None:
+                df = np.zeros(len(self.vocab))
+                for ids, _ in rows.values():
+                    df[ids] += 1
+            idf = np.log((1 + len(docs)) / (1 + df)) + 1
+            results = {}
+            for key, doc in sorted(docs.items()):
+                ids, counts = rows[key] if rows is not None else self.load_vector(self._row_file(doc["row"]))
+                weights = counts * idf[ids]
+                norm = np.sqrt(np.sum(weights ** 2))
+                results[key] = self._ranked(ids, weights / norm if norm else weights, top)
+            return results
+        names = sorted({doc[by] for doc in docs.values()},
+                       key=lambda name: PHASES.index(name) if name in PHASES else name)
+        vectors = []
+        for name in names:
+            if rows is None:
+                dense = self.group(by + "=" + name)
+            else:
+                dense = np.zeros(len(self.vocab))
+                for key, (ids, counts) in rows.items():
+                    if docs[key][by] == name:
+                        dense[ids] += counts
+            ids = np.flatnonzero(dense)
+            vectors.append((ids, dense[ids]))
+        scores = tfidf(vectors, len(self.vocab))
+        return {name: self._ranked(ids, score, top) for name, (ids, _), score in zip(names, vectors, scores)}
 
 def print_tfidf_results(file_name, results):
     print("-" * 30)
     print(f"\nResults for {file_name}:")
     for text, tfidf_values in results.items():
         print(f"{text}:")
-        # Print only the top 20 terms
-        for idx, (term, score) in enumerate(tfidf_values.items()):
-            # if idx == 20:
-            #     break
+        for term, score in tfidf_values.items():
             print(f"  {term}: {score:.4f}")
         print()
 
-if len(sys.argv) < 2:
-    print(f"Usage: python {sys.argv[0]} <file_path1> <file_path2> ...")
-    sys.exit(1)
-
-file_paths = sys.argv[1:]
-agglomerated_pre = []
-agglomerated_post = []
-for file_path in file_paths:
-    paragraphs = read_text_from_file(file_path)
-    agglomerated_pre.append(paragraphs[0].strip())
-    agglomerated_post.append(paragraphs[1].strip())
-    
-# print(agglomerated_pre)
-# print(agglomerated_post)
-pre_str = " ".join(agglomerated_pre)
-post_str = " ".join(agglomerated_post)
-# print(pre_str)
-# print(post_str)
-texts = [pre_str, post_str]
-
-# tfidf_results = perform_tfidf(agglomerated_pre, agglomerated_post)
-tfidf_results = perform_tfidf(texts)
-print_tfidf_results(file_path, tfidf_results)
+def main():
+    parser = argparse.ArgumentParser(description="TF-IDF of pre/post dream reports")
+    parser.add_argument("files", nargs="*", help="report files to add or refresh")
+    parser.add_argument("--index", default=INDEX_DIR)
+    parser.add_argument("--control", default="", help="comma separated control participants")
+    parser.add_argument("--by", choices=["phase", "condition", "participant", "document"], default="phase")
+    parser.add_argument("--top", type=int, help="terms per group, default all")
+    parser.add_argument("--prune", action="store_true", help="forget reports whose file is gone")
+    parser.add_argument("--all", action="store_true", help="score every indexed report, not only the files given")
+    args = parser.parse_args()
+
+    index = TfidfIndex(args.index)
+    control = set(filter(None, args.control.split(",")))
+    updated = [file_path for file_path in args.files if index.update_file(file_path, control)]
+    pruned = index.prune() if args.prune else 0
+    index.save()
+    print("{0} reports tokenized, {1} unchanged, {2} pruned, {3} documents indexed".format(
+        len(updated), len(args.files) - len(updated), pruned, len(index.docs)))
+    # The files given are the corpus, like the original script; none or --all: the whole index
+    keys = None
+    if args.files and not args.all:
+        keys = [key for file_path in args.files for key in index.keys_of(os.path.abspath(file_path))]
+    print_tfidf_results(args.index + " by " + args.by, index.top_terms_by(args.by, args.top, keys))
+
+if __name__ == '__main__':
+    sys.exit(main())
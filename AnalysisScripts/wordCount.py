@@ -1,40 +1,127 @@
-import sys
+# Incidence of incubation target words in dream reports, participant x term table
+# Every variant (language, plural) of every term is matched by one compiled pattern,
+# files are streamed line by line and scanned in parallel worker processes.
+# Usage: python3 wordCount.py <file>... [--term LABEL=variant,variant ...] [--csv FILE] [--plot FILE]
+# ex: python3 wordCount.py ../../Experiment/USERS/*/text --term tree=tree,trees,arbre,arbres
+import os
 import re
-import matplotlib.pyplot as plt
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
-def count_trees(file_path):
+DEFAULT_TERMS = {"tree": ["tree", "trees", "arbre", "arbres"]}
+
+_matcher = None     # Per worker process, see init_worker
+
+def parse_term(spec):
+    """ "tree=tree,trees,arbre" -> ("tree", [variants]), a bare word is its own variant """
+    label, _, variants = spec.partition("=")
+    variants = [variant.strip().lower() for variant in (variants or label).split(",") if variant.strip()]
+    if not label.strip() or not variants:
+        raise argparse.ArgumentTypeError("Bad term {0}, expected LABEL=variant,variant".format(spec))
+    return label.strip(), variants
+
+def compile_terms(terms):
+    """ One case-insensitive pattern for all variants, and variant -> label """
+    labels = {}
+    for label, variants in terms.items():
+        for variant in variants:
+            labels[variant] = label
+    # Longest first so a variant never shadows a longer one at the same position
+    alternation = "|".join(re.escape(variant) for variant in sorted(labels, key=len, reverse=True))
+    return re.compile(r"\b(?:" + alternation + r")\b", re.IGNORECASE), labels
+
+def init_worker(terms):
+    global _matcher
+    _matcher = compile_terms(terms)
+
+def count_terms(file_path):
+    """ Worker side, returns (file_path, Counter of labels) or (file_path, None) if missing """
+    pattern, labels = _matcher
+    counts = Counter()
     try:
-        with open(file_path, 'r') as file:
-            content = file.read()
-            # Case-insensitive and plural-insensitive search for "Trees"
-            tree_count = len(re.findall(r'\b[Tt]rees?\b', content, re.IGNORECASE))
-            return tree_count
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+            for line in file:
+                for match in pattern.findall(line):
+                    counts[labels[match.lower()]] += 1
     except FileNotFoundError:
-        print(f"Error: File not found - {file_path}")
-        return 0
+        return file_path, None
+    return file_path, counts
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python script.py file1 file2")
-        sys.exit(1)
+def participant_of(file_path):
+    """ <root>/<participant>/text layout, same as tfIDF.py """
+    return os.path.basename(os.path.dirname(os.path.abspath(file_path)))
 
-    file1_path = sys.argv[1]
-    file2_path = sys.argv[2]
+def count_files(file_paths, terms, workers=None):
+    """ {participant: Counter}, several files of one participant are summed """
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(file_paths) < 2:
+        init_worker(terms)
+        return _collect(map(count_terms, file_paths))
+    chunksize = max(1, len(file_paths) // (4 * workers))   # Hundreds of small reports, few round trips
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(terms,)) as pool:
+        return _collect(pool.map(count_terms, file_paths, chunksize=chunksize))
 
-    tree_count_file1 = count_trees(file1_path)
-    tree_count_file2 = count_trees(file2_path)
+def _collect(results):
+    table = {}
+    for file_path, counts in results:
+        if counts is None:
+            print(f"Error: File not found - {file_path}")
+            counts = Counter()
+        table.setdefault(participant_of(file_path), Counter()).update(counts)
+    return table
 
-    labels = [file1_path.split("/")[-1], file2_path.split("/")[-1]]
-    counts = [tree_count_file1, tree_count_file2]
+def ordered(table):
+    """ Numeric participant ids in numeric order, then the others """
+    return sorted(table, key=lambda p: (not p.isdigit(), int(p) if p.isdigit() else 0, p))
 
-    colors = ['blue', 'red']
+def format_table(table, labels, separator=None):
+    rows = [["participant"] + labels + ["total"]]
+    for participant in ordered(table):
+        counts = [table[participant][label] for label in labels]
+        rows.append([participant] + counts + [sum(counts)])
+    totals = [sum(table[p][label] for p in table) for label in labels]
+    rows.append(["total"] + totals + [sum(totals)])
+    if separator:
+        return "\n".join(separator.join(str(cell) for cell in row) for row in rows)
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)) for row in rows)
 
-    plt.bar(labels, counts, color=colors)
-    plt.xlabel('Files')
-    plt.ylabel('Occurrences of "Trees"')
-    plt.title('Occurrences of "Trees" in texts (case and plural insensitive)')
-    plt.savefig("TreesInTexts.png")
+def plot_table(table, labels, output):
+    import numpy as np
+    import matplotlib.pyplot as plt
+    participants = ordered(table)
+    width = 0.8 / len(labels)
+    for i, label in enumerate(labels):
+        plt.bar(np.arange(len(participants)) + i * width, [table[p][label] for p in participants],
+                width=width, label=label)
+    plt.xticks(np.arange(len(participants)) + 0.4 - width / 2, participants)
+    plt.xlabel('Participants')
+    plt.ylabel('Occurrences')
+    plt.title('Occurrences of target words in texts (case insensitive, all variants)')
+    plt.legend()
+    plt.savefig(output)
     plt.show()
 
+def main():
+    parser = argparse.ArgumentParser(description="Count target words per participant")
+    parser.add_argument("files", nargs="+", help="transcripts, participant is the parent directory")
+    parser.add_argument("--term", action="append", type=parse_term, dest="terms",
+                        help="LABEL=variant,variant (repeatable), default tree=tree,trees,arbre,arbres")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--csv", help="also write the table to this file")
+    parser.add_argument("--plot", help="bar chart image, ex: TreesInTexts.png")
+    args = parser.parse_args()
+    terms = dict(args.terms) if args.terms else DEFAULT_TERMS
+    labels = list(terms)
+
+    table = count_files(args.files, terms, args.workers)
+    print(format_table(table, labels))
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8") as f:
+            f.write(format_table(table, labels, separator=",") + "\n")
+    if args.plot:
+        plot_table(table, labels, args.plot)
+
 if __name__ == "__main__":
     main()
@@ -1,22 +1,40 @@
 # Itsybitsy board code (FSR/FLEX TDI)
 # Author: Alexis Dumelié
+# Sends one binary frame per sample (see serialframes.py on the host):
+#   0xA5 0x5A | seq uint16 | tick ms uint32 | ADC uint16 | checksum uint8
+# tick is supervisor.ticks_ms(), the host uses it for sample timestamps and gaps
 
 import time
+import struct
 import board
 import adafruit_dotstar
+import supervisor
+import usb_cdc
 from analogio import AnalogIn
 import busio
 
-uart = busio.UART(board.TX, board.RX, baudrate=9600)
+BAUD_RATE = 230400  # UART only, USB serial runs at USB speed
+USE_UART = False    # Frames on TX/RX pins instead of the USB serial port
+uart = busio.UART(board.TX, board.RX, baudrate=BAUD_RATE)
+serial_out = uart if USE_UART else usb_cdc.console
 
 input_voltage_max = 3.3
 eye_protection_offset = 0.75
 #==============================
 
-def get_voltage(pin):
+def get_voltage(value):
     voltage = 3.3
     bit_range = 65536 # 2^16
-    return (pin.value * voltage) / bit_range
+    return (value * voltage) / bit_range
+
+FRAME_SYNC = b'\xa5\x5a'
+frame = bytearray(11)
+frame[0:2] = FRAME_SYNC
+
+def send_frame(seq, tick, adc):
+    struct.pack_into('<HIH', frame, 2, seq, tick, adc)
+    frame[10] = sum(frame[2:10]) & 0xFF
+    serial_out.write(frame)
 
 #==============================
 analog_in = AnalogIn(board.A1)
@@ -25,9 +43,11 @@ dotstar = adafruit_dotstar.DotStar(board.APA102_SCK, board.APA102_MOSI, 1)
 dotstar.brightness = 0.0
 dotstar[0] = (255, 0, 0)  # Initialize the color to red
 
+seq = 0
 while True:
-    input_voltage = get_voltage(analog_in)
+    adc = analog_in.value
+    send_frame(seq, supervisor.ticks_ms(), adc)
+    seq = (seq + 1) & 0xFFFF
     time.sleep(0.001)
-    if input_voltage is not None:
-        dotstar.brightness = (input_voltage / input_voltage_max) - eye_protection_offset
-        print(input_voltage)
+    input_voltage = get_voltage(adc)
+    dotstar.brightness = max(0.0, (input_voltage / input_voltage_max) - eye_protection_offset)
@@ -2,23 +2,55 @@
 # Datacollector to interface with serial from itsybitsy
 # Author: Alexis Dumelié
 """
+import math
+import time
+import queue
 import random
+from time import perf_counter
 from PyQt5.QtCore import QThread, pyqtSignal
 from DEBUG_ENUM import DebugLevel
+from sessionlog import load_session
+from serialframes import FrameDecoder, adc_to_voltage
+from stagestats import StageStats
 
 class DataCollector(QThread):
-    value_updated = pyqtSignal(float)
+    frames_dropped = pyqtSignal(int)    # Total dropped frames so far
+    queue_overflow = pyqtSignal(int)    # Total samples lost on a full queue
 
-    def __init__(self, serial, debug_level, replay_file=None, parent=None):
+    STEP_MS = 10
+
+    def __init__(self, serial, debug_level, sample_queue, replay_file=None, stats=None, parent=None):
+        """ stats: acquisition tick, read stage, serial and queue backlogs recorded there """
         super().__init__(parent)
         self._stop = False
+        self.sample_queue = sample_queue    # (timestamp, value) to processing
+        self.QUEUE_TIMEOUT = 1.0    # seconds, processing stalled if still full
+        self.overflow = 0
         self.serial_interface = serial
         self.DEBUG = debug_level
         self.y_max = 1.5
+        self.decoder = FrameDecoder()
+        self.reported_dropped = 0
+        # Host time of device tick 0: smallest receive - device time, the least
+        # delayed transfer, renewed every CLOCK_WINDOW to follow clock drift
+        self.CLOCK_WINDOW = 60  # seconds
+        self.clock_offset = None
+        self._offset_min = math.inf
+        self._offset_since = 0
+        # Board frames (~1 kHz) decimated to one sample per STEP_MS of device time
+        self._window = None # STEP_MS window index of the frames being averaged
+        self._window_sum = 0.0
+        self._window_count = 0
+        self._window_last_ms = 0
+        self._last_timestamp = 0.0  # Kept monotonic across clock offset updates
+        self.stats = stats if stats is not None else StageStats()
+        self.stats.add_ticker("acquisition", self.STEP_MS / 1000)
+        self.first_sample = None    # time.time() of the first value, startup timing
 
         if self.DEBUG == DebugLevel.REPLAY:
             self.REPLAY_FILE = replay_file
             self.REPLAY_DATA = []
+            self.replay_index = 0
             if self.REPLAY_FILE:
                 self._load_replay_data()
 
@@ -26,49 +58,107 @@ class DataCollector(QThread):
         return self.y_max
 
     def _load_replay_data(self):
-        if self.REPLAY_FILE:
-            with open(self.REPLAY_FILE, 'r', encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            value = float(line)
-                            self.REPLAY_DATA.append(value)
-                        except ValueError:
-                            pass  # Ignore non-numeric data
+        # Binary or text log, text logs memory mapped from their .npy sidecar
+        _, self.REPLAY_DATA, _ = load_session(self.REPLAY_FILE, mmap=True)
     #------------------------------
     def run(self):
         while not self._stop:
-            value = self.get_value()
-            self.value_updated.emit(value)
-            self.msleep(10)  # Sleep for 10 milliseconds
+            self.stats.tick("acquisition")
+            start = perf_counter()
+            samples = self.get_samples()
+            self.stats.record("read", perf_counter() - start)
+            for timestamp, value in samples:
+                if self.first_sample is None:
+                    self.first_sample = time.time()
+                self.enqueue(timestamp, value)
+            self.msleep(self.STEP_MS)  # Sleep for 10 milliseconds
+
+    def enqueue(self, timestamp, value):
+        try:    # Block rather than drop while processing catches up
+            self.sample_queue.put((timestamp, value), timeout=self.QUEUE_TIMEOUT)
+            self.stats.gauge("queue_backlog", self.sample_queue.qsize())
+        except queue.Full:
+            self.overflow += 1
+            self.queue_overflow.emit(self.overflow)
 
     def stop(self):
         self._stop = True
     #------------------------------
 
-    def get_value(self):
+    def get_samples(self):
+        """ (timestamp, value) acquired since last call """
         if self.DEBUG == DebugLevel.DUMMY:
-            value = self._dummy_read()
+            samples = [(time.time(), self._dummy_read())]
         elif self.DEBUG == DebugLevel.REPLAY:
-            value = self._consume_replay_data()
+            samples = [(time.time(), self._consume_replay_data())]
         else:
-            value = self._read_serial_data()
+            samples = self._read_serial_data()
         if self.DEBUG >= DebugLevel.BASIC:
-            print(value)
-        return value
+            for _, value in samples:
+                print(value)
+        return samples
 
     def _dummy_read(self):
         return random.random() * self.y_max
 
     def _consume_replay_data(self):
         NO_MORE_DATA = 0
-        if self.REPLAY_DATA:
-            return self.REPLAY_DATA.pop(0)
+        if self.replay_index < len(self.REPLAY_DATA):
+            value = float(self.REPLAY_DATA[self.replay_index])   # O(1), no pop(0) shifting
+            self.replay_index += 1
+            return value
         return NO_MORE_DATA
 
     def _read_serial_data(self):
-        data = self.serial_interface.readline().decode().strip()
-        return float(data) if data else None
+        """
+        One sample per STEP_MS window of device time, every completed window
+        since last call: mean of its frames, at the device time of the last
+        one. The processing chain (filter, windows, calibration) runs at
+        100 Hz, a late wakeup queues several samples rather than merging them.
+        Windows without any frame (dropped) give no sample.
+        """
+        samples = []
+        for device_ms, value in self._read_serial_batch():
+            window = device_ms // self.STEP_MS
+            if window != self._window and self._window_count:
+                self._last_timestamp = max(self._last_timestamp, self.clock_offset + self._window_last_ms / 1000)
+                samples.append((self._last_timestamp, self._window_sum / self._window_count))
+                self._window_sum = 0.0
+                self._window_count = 0
+            self._window = window
+            self._window_sum += value
+            self._window_count += 1
+            self._window_last_ms = device_ms
+        return samples
+
+    def _read_serial_batch(self):
+        """ (device time ms, voltage) of every frame received, host clock mapping updated """
+        # Drain everything pending so nothing backs up in the OS buffer
+        waiting = self.serial_interface.in_waiting
+        self.stats.gauge("serial_backlog", waiting)   # bytes, left over since last read
+        data = self.serial_interface.read(waiting if waiting else 1) # Else wait up to port timeout
+        received = time.time()
+        frames = self.decoder.feed(data)
+        if self.decoder.dropped != self.reported_dropped:
+            self.reported_dropped = self.decoder.dropped
+            self.frames_dropped.emit(self.reported_dropped)
+        if not frames:
+            return []
+        self._update_clock(frames[-1][1], received)
+        return [(device_ms, adc_to_voltage(adc)) for _, device_ms, adc in frames]
+
+    def _update_clock(self, device_ms, received):
+        """ device_ms: device time of the last frame received at host time `received` """
+        offset = received - device_ms / 1000
+        self._offset_min = min(self._offset_min, offset)
+        if self.clock_offset is None:
+            self.clock_offset = offset
+            self._offset_since = received
+        elif received - self._offset_since >= self.CLOCK_WINDOW:
+            self.clock_offset = self._offset_min
+            self._offset_min = math.inf
+            self._offset_since = received
+        else:
+            self.clock_offset = min(self.clock_offset, offset)
 
 #----------------------------------------
@@ -0,0 +1,197 @@
+"""
+# Batch (whole array) OneEuroFilter and trigger detection for offline analysis
+# Same arithmetic as the streaming OneEuroFilter and ThresholdDetector, run
+# as compiled loops when numba is installed (pure Python loops otherwise).
+"""
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError: # Optional, same results only much slower
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+#----------------------------------------
+@njit(cache=True)
+def _alpha(freq, cutoff):
+    te = 1.0 / freq
+    tau = 1.0 / (2*math.pi*cutoff)
+    return 1.0 / (1.0 + tau/te)
+
+@njit(cache=True)
+def _one_euro_kernel(values, timestamps, has_timestamps, freq, mincutoff, beta, dcutoff):
+    # Mirrors OneEuroFilter.__call__ and its two LowPassFilter, step by step
+    n = values.shape[0]
+    out = np.empty(n)
+    lasttime = 0.0
+    x_s = 0.0
+    dx_s = 0.0
+    for i in range(n):
+        x = values[i]
+        if has_timestamps:
+            timestamp = timestamps[i]
+            if lasttime != 0.0 and timestamp != 0.0 and timestamp > lasttime:
+                freq = 1.0 / (timestamp - lasttime)
+            lasttime = timestamp
+        if i == 0:
+            dx = 0.0
+            edx = dx
+        else:
+            dx = (x - x_s)*freq
+            alpha = _alpha(freq, dcutoff)
+            edx = alpha*dx + (1.0 - alpha)*dx_s
+        dx_s = edx
+        cutoff = mincutoff + beta*math.fabs(edx)
+        if i == 0:
+            s = x
+        else:
+            alpha = _alpha(freq, cutoff)
+            s = alpha*x + (1.0 - alpha)*x_s
+        x_s = s
+        out[i] = s
+    return out
+
+def one_euro_filter(values, timestamps=None, freq=100, mincutoff=1.0, beta=0.0, dcutoff=1.0):
+    """
+    Filter a whole array, same output as calling OneEuroFilter(freq, ...)
+    once per value with the matching timestamp
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    has_timestamps = timestamps is not None
+    if has_timestamps:
+        timestamps = np.ascontiguousarray(timestamps, dtype=np.float64)
+    else:
+        timestamps = np.zeros(1)
+    return _one_euro_kernel(values, timestamps, has_timestamps, float(freq),
+                            float(mincutoff), float(beta), float(dcutoff))
+
+@njit(cache=True)
+def rolling_mean(values, window_values):
+    """ Mean over the last window_values samples, zero filled at start like RingBuffer """
+    n = values.shape[0]
+    out = np.empty(n)
+    total = 0.0
+    for i in range(n):
+        oldest = values[i - window_values] if i >= window_values else 0.0
+        total += values[i] - oldest
+        if i % window_values == window_values - 1:
+            total = 0.0 # Drift reset once per window
+            for j in range(i - window_values + 1, i + 1):
+                total += values[j]
+        out[i] = total / window_values
+    return out
+
+def calibration_average(values, timestamps, calibration_period):
+    """
+    Returns (end_index, average of raw values before end_index) as in
+    PlotWindow.update, end_index is the sample that switches to RUNNING
+    (len(values) if calibration never ends)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(values) == 0:
+        return 0, 0.0
+    over = np.flatnonzero(timestamps - timestamps[0] >= calibration_period)
+    end_index = int(over[0]) if len(over) else len(values)
+    if end_index == 0:
+        return 0, 0.0
+    return end_index, float(np.cumsum(values[:end_index])[-1]) / end_index
+
+@njit(cache=True)
+def _detect_kernel(avg, timestamps, start_index, stable_state, delta_percent,
+                   stable_window, grace_window, protocol_duration):
+    # Mirrors ThresholdDetector.update_grace/check and reset_trigger
+    n = avg.shape[0]
+    detections = np.empty(n, dtype=np.int64)
+    state_changes = np.zeros(n, dtype=np.int64)   # Per cycle
+    count = 0
+    stable = stable_state
+    new_state = 0.0
+    new_start = 0.0
+    changing = False
+    grace = False
+    grace_start = 0.0
+    triggered = False
+    protocol_end = 0.0
+    for i in range(start_index, n):
+        now = timestamps[i]
+        if triggered:
+            if now < protocol_end:
+                continue
+            triggered = False
+            stable = stable_state
+            new_state = 0.0
+            new_start = 0.0
+            changing = False
+            grace_start = now
+            grace = True
+        if now - grace_start >= grace_window:
+            grace = False
+        if grace:
+            continue
+        value = avg[i]
+        if changing:
+            if value >= new_state * (1 + delta_percent):
+                new_state = value
+                new_start = now
+            elif now - new_start >= stable_window:
+                detections[count] = i
+                count += 1
+                triggered = True
+                protocol_end = now + protocol_duration
+        elif value >= stable * (1 + delta_percent):
+            changing = True
+            new_state = value
+            new_start = now
+            state_changes[count] += 1
+    return detections[:count], state_changes[:count + 1]
+
+def detect(avg, timestamps, start_index, stable_state, sensor_repeatability=0.02,
+           state_change_range=0.015, stable_window=10, grace_window=10, protocol_duration=260):
+    """
+    Run the trigger state machine over a whole window average array
+    Returns (detection indices, state change count per cycle)
+    """
+    return _detect_kernel(np.ascontiguousarray(avg, dtype=np.float64),
+                          np.ascontiguousarray(timestamps, dtype=np.float64),
+                          int(start_index), float(stable_state),
+                          sensor_repeatability + state_change_range,
+                          float(stable_window), float(grace_window), float(protocol_duration))
+
+def warm_up():
+    """ Compiles (or loads from cache) every kernel on a tiny session, outside any timing """
+    values = np.full(16, 0.5)
+    run_session(values, 0.01 * np.arange(len(values)), {"freq": 100}, window_values=4, calibration_period=0.05)
+
+#----------------------------------------
+def filter_session(values, filter_config):
+    """ Filter with the timestamps PlotWindow.update_data gives the live filter """
+    return one_euro_filter(values, 0.001 * np.arange(len(values)), **filter_config)
+
+def run_session(values, timestamps, filter_config, detector_config=None, window_values=1000,
+                calibration_period=90, protocol_duration=260, filtered=None):
+    """
+    Batch equivalent of ReplayEngine.run (detections only)
+    filtered can be passed to reuse an already filtered signal
+    """
+    detector_config = detector_config or {}
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if filtered is None:
+        filtered = filter_session(values, filter_config)
+    avg = rolling_mean(filtered, window_values)
+    end_index, cal_avg = calibration_average(values, timestamps, calibration_period)
+    detections, state_changes = detect(avg, timestamps, end_index + 1, cal_avg,
+                                       protocol_duration=protocol_duration, **detector_config)
+    start_time = timestamps[0] if len(timestamps) else 0.0
+    return {
+            "samples": len(values),
+            "calibration_end": (timestamps[end_index] - start_time) if end_index < len(values) else None,
+            "calibration_avg": cal_avg,
+            "detections": [float(timestamps[i] - start_time) for i in detections],
+            "state_changes": state_changes.tolist(),
+            }
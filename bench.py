@@ -0,0 +1,308 @@
+"""
+# Benchmarks of the acquisition to detection hot path, no display or board needed
+#   per_sample:  SignalProcessor.process (filter, window average, detector, log) per sample
+#   snapshot:    viewer tick (PlotWindow.update_plot snapshot + overview query)
+#   throughput:  producer thread at 100 Hz / 1 kHz / 10 kHz into the sample queue,
+#                consumer as ProcessingThread.run: achieved rate, backlog, queue latency
+#   parse:       text and binary log loading, replay (streaming and batch kernels)
+#   night:       memory growth of a whole simulated night (history, session log)
+# Signal is synthetic (drowsy ramp + noise) or a recorded log (--log), repeated as needed.
+# Usage: python bench.py [--quick] [--log LOG] [--json out.json] [--baseline base.json] [--tolerance 0.25]
+#        python bench.py --only per_sample,throughput --json new.json --baseline base.json
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+import batch
+from processing import SignalProcessor, FILTER_CONFIG, WINDOW_VALUES, CALIBRATION_PERIOD
+from replay import ReplayEngine, PROTOCOL_DURATION
+from sessionlog import SessionLog, load_session, load_text_log
+
+SAMPLE_PERIOD = 0.01
+RATES = [100, 1000, 10000]  # Hz
+SUITES = ["per_sample", "snapshot", "throughput", "parse", "night"]
+
+def synthetic_signal(n, sample_period=SAMPLE_PERIOD, seed=0):
+    """ Awake baseline, then a rise every 20 min (sleep onset), sensor noise """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) * sample_period
+    phase = t % 1200
+    rise = np.clip((phase - 600) / 30, 0, 1) * 0.05
+    return 0.55 + rise + rng.normal(0, 0.002, n)
+
+def signal_of(n, log=None):
+    if log is None:
+        return synthetic_signal(n)
+    _, values, _ = load_session(log)
+    return np.resize(np.asarray(values, dtype=np.float64), n)   # Repeated up to n samples
+
+def rss_mb():
+    """ Resident memory now (Linux), peak otherwise """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def metric(value, unit, better="lower"):
+    """ better: "lower", "higher", None for metrics never counted as regressions """
+    return {"value": float(value), "unit": unit, "better": better}
+
+def percentiles(name, durations_ns, unit_scale=1e-3, unit="us"):
+    durations = np.asarray(durations_ns) * unit_scale
+    return {
+            name + ".mean": metric(durations.mean(), unit),
+            name + ".p50": metric(np.percentile(durations, 50), unit),
+            name + ".p99": metric(np.percentile(durations, 99), unit),
+            name + ".max": metric(durations.max(), unit, better=None),  # One preemption away, reported only
+            }
+
+#----------------------------------------
+def bench_per_sample(values, work_dir, detector="threshold"):
+    """ process() of every sample, calibration included, session log on disk """
+    log = SessionLog(os.path.join(work_dir, "per_sample_" + detector))
+    processor = SignalProcessor(log, calibration_period=CALIBRATION_PERIOD, keep_history=True,
+                                detector=detector)
+    durations = np.empty(len(values), dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i, value in enumerate(values.tolist()):
+        start = clock()
+        processor.process(value, i * SAMPLE_PERIOD)
+        durations[i] = clock() - start
+    log.close()
+    results = percentiles("per_sample." + detector, durations)
+    # 10 ms budget per sample at 100 Hz
+    results["per_sample." + detector + ".budget_used"] = metric(
+        100 * durations.mean() / (SAMPLE_PERIOD * 1e9), "%")
+    return results
+
+def bench_snapshot(values, repeats=2000):
+    """ What the viewer takes from the processing side each repaint """
+    processor = SignalProcessor(keep_history=True)
+    for i, value in enumerate(values.tolist()):
+        processor.process(value, i * SAMPLE_PERIOD)
+    clock = time.perf_counter_ns
+    snapshots = np.empty(repeats, dtype=np.int64)
+    overviews = np.empty(repeats, dtype=np.int64)
+    for i in range(repeats):
+        start = clock()
+        processor.snapshot(1000)
+        snapshots[i] = clock() - start
+        start = clock()
+        processor.history.query(max_points=1000)
+        overviews[i] = clock() - start
+    results = percentiles("snapshot.window", snapshots)
+    results.update(percentiles("snapshot.overview", overviews))
+    return results
+
+def bench_throughput(values, rate, duration, detector="threshold"):
+    """
+    Producer puts samples at `rate` in 1 ms batches (acquisition thread),
+    consumer loop of ProcessingThread.run processes them. Achieved rate below
+    the input rate, or a growing backlog, means the hot path cannot keep up.
+    """
+    processor = SignalProcessor(calibration_period=min(CALIBRATION_PERIOD, duration / 2), detector=detector)
+    sample_queue = queue.Queue(maxsize=10000)
+    n = int(rate * duration)
+    samples = np.resize(values, n).tolist()
+    period = 1.0 / rate
+    latencies = np.zeros(n)
+    backlog = [0]
+    processed = [0]
+    finished = [0.0]    # Time the last sample was processed
+    stop = threading.Event()
+
+    def consume():
+        while not stop.is_set() or not sample_queue.empty():
+            try:
+                index, timestamp, value = sample_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            processor.process(value, timestamp)
+            finished[0] = time.perf_counter()
+            latencies[index] = finished[0] - timestamp
+            processed[0] += 1
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    start = time.perf_counter()
+    lost = 0
+    sent = 0
+    while sent < n:
+        due = min(n, int((time.perf_counter() - start) / period) + 1)
+        while sent < due:
+            try:
+                sample_queue.put_nowait((sent, time.perf_counter(), samples[sent]))
+            except queue.Full:
+                lost += 1
+            sent += 1
+        backlog[0] = max(backlog[0], sample_queue.qsize())
+        time.sleep(0.001)
+    produced = time.perf_counter() - start
+    stop.set()
+    consumer.join()
+    elapsed = max(finished[0], start + produced) - start
+    name = "throughput.{0}.{1}hz".format(detector, rate)
+    done = latencies[latencies > 0]
+    return {
+            name + ".achieved": metric(processed[0] / elapsed, "samples/s", "higher"),
+            name + ".keeps_up": metric(100 * min(1.0, produced / elapsed), "%", "higher"),
+            name + ".max_backlog": metric(backlog[0], "samples"),
+            name + ".lost": metric(lost, "samples"),
+            name + ".queue_latency.p99": metric(1000 * np.percentile(done, 99) if len(done) else 0, "ms"),
+            }
+
+def bench_parse(values, work_dir):
+    """ Same samples as a text log and a binary session log """
+    n = len(values)
+    text_log = os.path.join(work_dir, "parse.datalog")
+    with open(text_log, "w") as f:
+        f.write("\n".join(map(str, values.tolist())) + "\n")
+    binary_log = os.path.join(work_dir, "parse")
+    log = SessionLog(binary_log)
+    for i, value in enumerate(values.tolist()):
+        log.append_sample(i * SAMPLE_PERIOD, value)
+    log.close()
+    results = {}
+    start = time.perf_counter()
+    load_text_log(text_log, cache=False)
+    seconds = time.perf_counter() - start
+    results["parse.text"] = metric(n / seconds, "samples/s", "higher")
+    results["parse.text_mb"] = metric(os.path.getsize(text_log) / 2**20 / seconds, "MB/s", "higher")
+    load_text_log(text_log)    # Writes the .npy sidecars
+    start = time.perf_counter()
+    load_text_log(text_log, mmap=True)
+    results["parse.text_sidecar"] = metric(1000 * (time.perf_counter() - start), "ms")
+    start = time.perf_counter()
+    timestamps, loaded, _ = load_session(binary_log)
+    results["parse.binary"] = metric(n / (time.perf_counter() - start), "samples/s", "higher")
+
+    start = time.perf_counter()
+    ReplayEngine().run(np.asarray(loaded, dtype=np.float64), np.asarray(timestamps))
+    results["replay.stream"] = metric(n / (time.perf_counter() - start), "samples/s", "higher")
+    batch.run_session(loaded, timestamps, FILTER_CONFIG)    # Compilation outside the timing
+    start = time.perf_counter()
+    batch.run_session(loaded, timestamps, FILTER_CONFIG, None, WINDOW_VALUES, CALIBRATION_PERIOD,
+                      PROTOCOL_DURATION)
+    results["replay.batch"] = metric(n / (time.perf_counter() - start), "samples/s", "higher")
+    return results
+
+def bench_night(hours, work_dir, log=None, checkpoints=8):
+    """
+    One night at 100 Hz through SignalProcessor with history and session log,
+    generated an hour at a time so the signal itself does not count.
+    Growth is what the processing side keeps, ideally the history pyramid only.
+    """
+    session_log = SessionLog(os.path.join(work_dir, "night"))
+    processor = SignalProcessor(session_log, keep_history=True)
+    n = int(hours * 3600 / SAMPLE_PERIOD)
+    chunk = max(1, n // checkpoints)
+    before = rss_mb()
+    trace = []
+    start = time.perf_counter()
+    for first in range(0, n, chunk):
+        count = min(chunk, n - first)
+        chunk_values = signal_of(count, log) if log else synthetic_signal(count, seed=first)
+        for i, value in enumerate(chunk_values.tolist()):
+            processor.process(value, (first + i) * SAMPLE_PERIOD)
+        trace.append(round(rss_mb() - before, 2))
+    elapsed = time.perf_counter() - start
+    session_log.close()
+    return {
+            "night.growth": metric(trace[-1], "MB"),
+            "night.growth_per_hour": metric(trace[-1] / hours, "MB/h"),
+            "night.speedup": metric(hours * 3600 / elapsed, "x realtime", "higher"),
+            }, trace
+
+#----------------------------------------
+def compare(results, baseline, tolerance):
+    """ Prints both runs side by side, returns the regressed metric names """
+    regressions = []
+    print("{0:40} {1:>14} {2:>14} {3:>8}".format("metric", "baseline", "now", "change"))
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print("{0:40} {1:>14} {2:>14.4g} {3:>8}".format(name, "-", current["value"], "new"))
+            continue
+        if reference["value"] == 0:
+            change = 0.0 if current["value"] == 0 else float("inf")
+        else:
+            change = current["value"] / reference["value"] - 1
+        if current["better"] == "lower":
+            worse = change > tolerance
+        else:
+            worse = current["better"] == "higher" and change < -tolerance
+        if worse:
+            regressions.append(name)
+        print("{0:40} {1:>14.4g} {2:>14.4g} {3:>+7.0%}{4}".format(
+            name, reference["value"], current["value"], change, " REGRESSION" if worse else ""))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path benchmarks, headless")
+    parser.add_argument("--log", help="recorded session log as signal, default synthetic")
+    parser.add_argument("--only", help="comma separated suites among " + ", ".join(SUITES))
+    parser.add_argument("--samples", type=int, default=60000, help="per_sample, snapshot and parse size")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per throughput rate")
+    parser.add_argument("--night-hours", type=float, default=8.0)
+    parser.add_argument("--detector", action="append", help="per_sample and throughput detectors, default threshold and cusum")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast check")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative change counted as regression")
+    args = parser.parse_args()
+    suites = args.only.split(",") if args.only else SUITES
+    if args.quick:
+        args.samples, args.duration, args.night_hours = 20000, 1.0, 0.5
+
+    values = signal_of(max(args.samples, CALIBRATION_PERIOD * 100 * 2), args.log)
+    work_dir = tempfile.mkdtemp(prefix="tdi_bench_")
+    detectors = args.detector or ["threshold", "cusum"]
+    results = {}
+    extra = {}
+    try:
+        for detector in detectors if "per_sample" in suites else []:
+            results.update(bench_per_sample(values, work_dir, detector))
+        if "snapshot" in suites:
+            results.update(bench_snapshot(values))
+        for detector in detectors if "throughput" in suites else []:
+            for rate in RATES:
+                results.update(bench_throughput(values, rate, args.duration, detector))
+        if "parse" in suites:
+            results.update(bench_parse(values, work_dir))
+        if "night" in suites:
+            night, extra["night_trace_mb"] = bench_night(args.night_hours, work_dir, args.log)
+            results.update(night)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for name, result in results.items():
+        print("{0:40} {1:>14.4g} {2}".format(name, result["value"], result["unit"]))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(),
+                       "signal": args.log or "synthetic", "time": time.time(),
+                       "results": results, "extra": extra}, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print()
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("{0} regressions: {1}".format(len(regressions), ", ".join(regressions)))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
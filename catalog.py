@@ -0,0 +1,289 @@
+"""
+# SQLite catalog of sessions (LOGS/, binary or text logs) and recordings (REC/)
+# Rescans only new or changed files, queries never reparse a log.
+# Usage: python catalog.py scan [<root> ...]          (default LOGS REC)
+#        python catalog.py sessions [--participant P] [--detected-within S] [--since DATE]
+#        python catalog.py recordings [--participant P] [--session ID]
+#        python catalog.py sql "SELECT ..."
+"""
+import os
+import re
+import sys
+import json
+import time
+import wave
+import sqlite3
+import argparse
+from datetime import datetime
+
+from sessionlog import (SAMPLES_EXT, EVENTS_EXT, EVENT_PHASE, EVENT_CAL_AVG, EVENT_DROPPED,
+                        EVENT_OVERFLOW, is_session_log, load_session, parse_text_line)
+
+DEFAULT_DB = "catalog.sqlite"
+DEFAULT_ROOTS = ["LOGS", "REC"]
+SAMPLE_PERIOD = 0.01    # Text logs have no timestamps
+STAMP = re.compile(r"(\d{4}-\d\d-\d\d_\d\d:\d\d:\d\d(?:\.\d+)?)")
+RECORDING = re.compile(r"^(?P<prefix>.*?)" + STAMP.pattern + r"cycle_(?P<cycle>\d+)$")
+SKIPPED_EXT = (EVENTS_EXT, ".npy", ".npz", ".png", ".json", ".flac", ".tmp", ".sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, signature TEXT NOT NULL, kind TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, format TEXT NOT NULL,
+    participant TEXT, start_time REAL, duration REAL, samples INTEGER,
+    calibration_avg REAL, calibration_end REAL, detections INTEGER,
+    first_detection REAL, dropped INTEGER, overflow INTEGER);
+CREATE TABLE IF NOT EXISTS events (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    t REAL, sample_index INTEGER, kind TEXT, payload TEXT);
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY, session_id INTEGER REFERENCES sessions(id) ON DELETE SET NULL,
+    participant TEXT, cycle INTEGER, start_time REAL, duration REAL, speech_duration REAL);
+CREATE INDEX IF NOT EXISTS sessions_participant ON sessions(participant);
+CREATE INDEX IF NOT EXISTS sessions_first_detection ON sessions(first_detection);
+CREATE INDEX IF NOT EXISTS sessions_start ON sessions(start_time);
+CREATE INDEX IF NOT EXISTS events_session ON events(session_id, kind);
+CREATE INDEX IF NOT EXISTS recordings_session ON recordings(session_id);
+"""
+
+def connect(db_path=DEFAULT_DB):
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(SCHEMA)
+    return db
+
+#----------------------------------------
+def parse_stamp(name):
+    """ Wall clock of str(datetime.now()).replace(" ", "_") in a name, None if absent """
+    match = STAMP.search(name)
+    if not match:
+        return None
+    stamp = match.group(1)
+    return datetime.strptime(stamp, "%Y-%m-%d_%H:%M:%S.%f" if "." in stamp else "%Y-%m-%d_%H:%M:%S").timestamp()
+
+def participant_of(path):
+    """ USERS/<id>/... directory, else the <participant>_ prefix of multi-participant names """
+    parts = os.path.normpath(path).split(os.sep)
+    if "USERS" in parts[:-1]:
+        return parts[parts.index("USERS") + 1]
+    name = os.path.basename(path)
+    match = STAMP.search(name)
+    if match and match.start() > 1 and name[match.start() - 1] == "_":
+        return name[:match.start() - 1]
+    return None
+
+def signature(*paths):
+    stats = [os.stat(path) for path in paths if os.path.exists(path)]
+    return ";".join("{0}:{1}".format(stat.st_size, stat.st_mtime_ns) for stat in stats)
+
+def is_text_log(path):
+    """ Old text LOGS format: a sample value among the first lines """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            head = f.read(4096)
+    except (OSError, UnicodeDecodeError):
+        return False
+    for line in head.splitlines()[:-1] or head.splitlines():
+        entry = parse_text_line(line)
+        if entry is not None and entry[0] is None:
+            return True
+    return False
+
+def is_wav(path):
+    try:
+        with open(path, "rb") as f:
+            header = f.read(12)
+    except OSError:
+        return False
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+def find_files(roots):
+    """ Yields (kind, path, signature), kind 'session' or 'recording' """
+    for root in roots:
+        for directory, _, names in os.walk(root):
+            for name in sorted(names):
+                path = os.path.join(directory, name)
+                if name.endswith(SAMPLES_EXT):
+                    base = path[:-len(SAMPLES_EXT)]
+                    yield "session", base, signature(base + SAMPLES_EXT, base + EVENTS_EXT)
+                elif name.endswith(SKIPPED_EXT):
+                    continue
+                elif RECORDING.match(name) and is_wav(path):
+                    yield "recording", path, signature(path, path + ".json")
+                elif not is_session_log(path) and is_text_log(path):
+                    yield "session", path, signature(path)
+
+#----------------------------------------
+def summarise_session(path):
+    """ Session row values and its events, times relative to the first sample """
+    binary = is_session_log(path)
+    timestamps, values, events = load_session(path, SAMPLE_PERIOD, mmap=True)
+    origin = timestamps[0] if len(timestamps) else (events[0][0] if events else 0.0)
+    stamp = parse_stamp(os.path.basename(path)) # Session creation, before the first sample
+    start_time = stamp if stamp is not None or not binary else origin
+    events = [(t - origin, index, kind, payload) for t, index, kind, payload in events]
+    phases = [(t, payload) for t, _, kind, payload in events if kind == EVENT_PHASE]
+    detections = [t for t, phase in phases if phase == "DETECTED"]
+    calibration_end = next((t for t, phase in phases if phase == "RUNNING"), None)
+    def last_number(kind, convert):
+        found = [payload for _, _, event_kind, payload in events if event_kind == kind]
+        try:
+            return convert(found[-1]) if found else None
+        except ValueError:
+            return None
+    row = {
+            "format": "binary" if binary else "text",
+            "participant": participant_of(path),
+            "start_time": start_time,
+            "duration": float(timestamps[-1] - timestamps[0]) if len(timestamps) > 1 else 0.0,
+            "samples": len(values),
+            "calibration_avg": last_number(EVENT_CAL_AVG, float),
+            "calibration_end": calibration_end,
+            "detections": len(detections),
+            "first_detection": detections[0] if detections else None,
+            "dropped": last_number(EVENT_DROPPED, int),
+            "overflow": last_number(EVENT_OVERFLOW, int),
+            }
+    return row, events
+
+def summarise_recording(path):
+    match = RECORDING.match(os.path.basename(path))
+    with wave.open(path, "rb") as wf:
+        duration = wf.getnframes() / wf.getframerate()
+    speech_duration = None
+    if os.path.exists(path + ".json"):  # postprocess.py sidecar
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            speech_duration = json.load(f).get("trimmed_duration")
+    prefix = match.group("prefix")
+    return {
+            "participant": participant_of(path) or (prefix[:-1] if prefix.endswith("_") else None),
+            "cycle": int(match.group("cycle")),
+            "start_time": parse_stamp(match.group(2)),
+            "duration": duration,
+            "speech_duration": speech_duration,
+            }
+
+def store_session(db, path, row, events):
+    db.execute("DELETE FROM sessions WHERE path = ?", (path,))
+    columns = ", ".join(row)
+    cursor = db.execute("INSERT INTO sessions (path, {0}) VALUES (?{1})".format(columns, ", ?" * len(row)),
+                        (path, *row.values()))
+    session_id = cursor.lastrowid
+    db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)",
+                   [(session_id, *event) for event in events])
+
+def link_recordings(db):
+    """ A recording belongs to the session of its participant running at its start """
+    db.execute("""
+        UPDATE recordings SET session_id = (
+            SELECT s.id FROM sessions s
+            WHERE s.start_time <= recordings.start_time
+              AND (s.participant IS recordings.participant
+                   OR s.participant IS NULL OR recordings.participant IS NULL)
+            ORDER BY s.start_time DESC LIMIT 1)
+        WHERE start_time IS NOT NULL""")
+
+def scan(db, roots=DEFAULT_ROOTS, verbose=True):
+    """ Returns (files parsed, files unchanged, files removed) """
+    known = dict(db.execute("SELECT path, signature FROM files"))
+    seen = set()
+    parsed = unchanged = 0
+    for kind, path, current in find_files([root for root in roots if os.path.isdir(root)]):
+        seen.add(path)
+        if known.get(path) == current:
+            unchanged += 1
+            continue
+        try:
+            if kind == "session":
+                row, events = summarise_session(path)
+                store_session(db, path, row, events)
+            else:
+                row = summarise_recording(path)
+                db.execute("INSERT OR REPLACE INTO recordings (path, {0}) VALUES (?{1})".format(
+                        ", ".join(row), ", ?" * len(row)), (path, *row.values()))
+        except (OSError, ValueError, EOFError, wave.Error) as error:
+            print("Skipped {0}: {1}".format(path, error))
+            continue
+        db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, current, kind))
+        parsed += 1
+        if verbose:
+            print("Indexed " + path)
+    removed = [path for path in known if path not in seen
+               and any(path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)]
+    for path in removed:
+        db.execute("DELETE FROM sessions WHERE path = ?", (path,))
+        db.execute("DELETE FROM recordings WHERE path = ?", (path,))
+        db.execute("DELETE FROM files WHERE path = ?", (path,))
+    link_recordings(db)
+    db.commit()
+    return parsed, unchanged, len(removed)
+
+#----------------------------------------
+def print_rows(cursor):
+    columns = [description[0] for description in cursor.description]
+    rows = cursor.fetchall()
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join("" if value is None else
+                        "{0:.3f}".format(value) if isinstance(value, float) else str(value)
+                        for value in row))
+    return len(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Session and recording catalog")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    scan_parser = commands.add_parser("scan", help="index new or changed files")
+    scan_parser.add_argument("roots", nargs="*", default=DEFAULT_ROOTS)
+    sessions_parser = commands.add_parser("sessions", help="list sessions")
+    sessions_parser.add_argument("--participant")
+    sessions_parser.add_argument("--detected-within", type=float, metavar="S",
+                                 help="first detection at most S seconds after calibration end")
+    sessions_parser.add_argument("--since", help="YYYY-MM-DD")
+    recordings_parser = commands.add_parser("recordings", help="list recordings")
+    recordings_parser.add_argument("--participant")
+    recordings_parser.add_argument("--session", type=int)
+    sql_parser = commands.add_parser("sql", help="run a query")
+    sql_parser.add_argument("query")
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    start = time.perf_counter()
+    if args.command == "scan":
+        parsed, unchanged, removed = scan(db, args.roots)
+        print("{0} indexed, {1} unchanged, {2} removed".format(parsed, unchanged, removed))
+    elif args.command == "sessions":
+        where, params = [], []
+        if args.participant:
+            where.append("participant = ?")
+            params.append(args.participant)
+        if args.detected_within is not None:
+            where.append("first_detection - calibration_end <= ?")
+            params.append(args.detected_within)
+        if args.since:
+            where.append("start_time >= ?")
+            params.append(datetime.strptime(args.since, "%Y-%m-%d").timestamp())
+        query = """SELECT id, participant, datetime(start_time, 'unixepoch', 'localtime') AS start,
+                   duration, calibration_avg, calibration_end, detections, first_detection, path
+                   FROM sessions {0} ORDER BY start_time""".format(
+                       "WHERE " + " AND ".join(where) if where else "")
+        print_rows(db.execute(query, params))
+    elif args.command == "recordings":
+        where, params = [], []
+        if args.participant:
+            where.append("participant = ?")
+            params.append(args.participant)
+        if args.session is not None:
+            where.append("session_id = ?")
+            params.append(args.session)
+        query = """SELECT session_id, participant, cycle, duration, speech_duration, path
+                   FROM recordings {0} ORDER BY start_time""".format(
+                       "WHERE " + " AND ".join(where) if where else "")
+        print_rows(db.execute(query, params))
+    else:
+        print_rows(db.execute(args.query))
+    print("({0:.1f} ms)".format((time.perf_counter() - start) * 1000), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+# Session checkpoints: calibration, detector and protocol state of an engine,
+# written atomically next to the session log (<log>.checkpoint.json) so a
+# crashed or unplugged session resumes without recalibrating the participant.
+"""
+import os
+import glob
+import json
+
+CHECKPOINT_EXT = ".checkpoint.json"
+VERSION = 1
+
+def checkpoint_path(log_file):
+    return log_file + CHECKPOINT_EXT
+
+def save_checkpoint(path, state):
+    """ Write then rename, a crash leaves the previous checkpoint intact """
+    temp_file = path + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(dict(state, version=VERSION), f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+def load_checkpoint(path):
+    """ path: checkpoint file or session log it belongs to """
+    if not path.endswith(CHECKPOINT_EXT):
+        path = checkpoint_path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("version") != VERSION:
+        raise ValueError("Checkpoint {0}: version {1}, expected {2}".format(path, state.get("version"), VERSION))
+    return state
+
+def latest_checkpoint(directory="LOGS", participant=None):
+    """ Most recent checkpoint of a session not stopped cleanly, None if none """
+    candidates = []
+    for path in glob.glob(os.path.join(directory, "*" + CHECKPOINT_EXT)):
+        try:
+            state = load_checkpoint(path)
+        except (OSError, ValueError):
+            continue    # Unreadable or other version, never resumed implicitly
+        if state.get("closed") or (participant and state.get("participant") != participant):
+            continue
+        candidates.append((state.get("saved_at", 0), path))
+    return max(candidates)[1] if candidates else None
@@ -0,0 +1,218 @@
+"""
+# Sleep onset trigger detection (state machine from PlotWindow.check_for_trigger)
+#   threshold: new stable state above the calibration bound (original detector)
+#   cusum:     change point on the filtered signal, fires as soon as the rise is significant
+"""
+import time
+
+class Detector:
+    """
+    Interface of the detectors, per sample from SignalProcessor:
+        update(value)   every filtered sample, O(1)
+        check(avg)      1 s window average, after calibration, outside grace
+    Clock is injected so the same detector runs live (time.time)
+    or on replayed data (clock driven by sample index or timestamp).
+    FIRST_CROSSING: time the average first crossed the calibration bound
+    since (re)arming, the reference of the decision latency.
+    STATE_FIELDS: what a checkpoint keeps, the rest restarts on rearm.
+    """
+    STATE_FIELDS = ("STABLE_STATE",)
+
+    def __init__(self, clock=time.time, sensor_repeatability=0.02, state_change_range=0.015,
+                 grace_window=10):
+        self.clock = clock
+        self.SENSOR_REPEATABILITY = sensor_repeatability
+        self.STATE_CHANGE_RANGE = state_change_range
+        self.DELTA_PERCENT = sensor_repeatability + state_change_range
+        self.GRACE_WINDOW = grace_window
+        self.STABLE_STATE = 0
+        self.STATE_CHANGING = False
+        self.FIRST_CROSSING = None
+        self.GRACE_PERIOD_START = 0
+        self.GRACE = False
+
+    def set_stable_state(self, stable_state):
+        self.STABLE_STATE = stable_state
+
+    def reset(self, stable_state):  # Called on Recorder termination
+        self.STABLE_STATE = stable_state
+        self.STATE_CHANGING = False
+        self.FIRST_CROSSING = None
+        self.GRACE_PERIOD_START = self.clock()
+        self.GRACE = True
+
+    def update_grace(self):
+        if self.clock() - self.GRACE_PERIOD_START >= self.GRACE_WINDOW:
+            self.GRACE = False
+        return self.GRACE
+
+    def state(self):
+        return {name: getattr(self, name) for name in self.STATE_FIELDS}
+
+    def restore(self, state):
+        for name in self.STATE_FIELDS:
+            if name in state:
+                setattr(self, name, state[name])
+
+    def update(self, value):
+        pass
+
+    def check(self, avg):
+        """ Returns True when sleep onset is detected """
+        raise NotImplementedError
+
+    def crossed(self, avg, now):
+        """ Average above the calibration bound, first crossing recorded """
+        if avg >= self.STABLE_STATE * (1 + self.DELTA_PERCENT):
+            if self.FIRST_CROSSING is None:
+                self.FIRST_CROSSING = now
+            return True
+        return False
+
+    def decision_latency(self):
+        """ Seconds from the first threshold crossing to now, None if never crossed """
+        if self.FIRST_CROSSING is None:
+            return None
+        return self.clock() - self.FIRST_CROSSING
+
+    def describe(self):
+        """ Detector state at decision time, logged with the detection """
+        return {}
+
+class ThresholdDetector(Detector):
+    def __init__(self, clock=time.time, sensor_repeatability=0.02, state_change_range=0.015,
+                 stable_window=10, grace_window=10):
+        super().__init__(clock, sensor_repeatability, state_change_range, grace_window)
+        self.NEW_STABLE_STATE_TIME_WINDOW = stable_window # seconds
+        self.NEW_STATE = 0
+        self.NEW_STATE_START_TIME = 0
+
+    def reset(self, stable_state):
+        super().reset(stable_state)
+        self.NEW_STATE = 0
+        self.NEW_STATE_START_TIME = 0
+
+    def check(self, avg):
+        """
+        Returns True when a new stable state is detected
+        Base case:
+            State has no yet changed
+            If our current value is above the original state + delta
+            then we are in a changing phase
+            Set new state as being current value
+            Start timer (timer is reset upon value changing out of bounded range)
+        Changing case:
+            We are in changing state, we have passed out of the range
+            from the original stable state
+            New upper bound based on previous new state + delta
+            Now see if we are still changing (value is above this new bound)
+            Or if we are within bound of the new state
+            If above, we are still changing, set new state, reset state timer
+            If still in range: check timer, are we potentially waiting to
+            climb more ? Or have we been in this new state for long enough ?
+            If we have been here for long enough then this is a NEW STABLE state
+            Hence we have achieved detection !
+        Caller handles grace (update_grace) and already triggered states.
+        """
+        now = self.clock()
+        if self.STATE_CHANGING:
+            # NOTE: What if we go back down ?
+            changing_state_upper_bound = self.NEW_STATE * (1 + self.DELTA_PERCENT)
+            if avg >= changing_state_upper_bound:
+                self.NEW_STATE = avg # Still changing
+                self.NEW_STATE_START_TIME = now
+            else:
+                STABILIZED = now - self.NEW_STATE_START_TIME >= self.NEW_STABLE_STATE_TIME_WINDOW
+                if STABILIZED:
+                    return True
+        else: # Still in range of original stable state
+            if self.crossed(avg, now):
+                self.STATE_CHANGING = True
+                self.NEW_STATE = avg
+                self.NEW_STATE_START_TIME = now
+        return False
+
+class ChangePointDetector(Detector):
+    """
+    One sided CUSUM of the relative rise of the filtered signal over the
+    calibration average, no stabilisation wait:
+        r = value / STABLE_STATE - 1
+        S = max(0, S + (r - drift) * dt)      detection when S >= threshold
+    drift (default: sensor repeatability) ignores rises within sensor noise,
+    threshold is in relative rise x seconds: 0.05 is 3.3 s at the original
+    +3.5 % bound, 1 s at +7 %. Running mean, variance and slope of r
+    (exponential, time constant `window`) are kept per sample in O(1) and
+    logged with the decision.
+    """
+    def __init__(self, clock=time.time, sensor_repeatability=0.02, state_change_range=0.015,
+                 grace_window=10, drift=None, threshold=0.05, window=1.0):
+        super().__init__(clock, sensor_repeatability, state_change_range, grace_window)
+        self.DRIFT = sensor_repeatability if drift is None else drift
+        self.THRESHOLD = threshold
+        self.WINDOW = window    # seconds
+        self.value = None
+        self.relative = 0.0
+        self.last_update = None
+        self.last_check = None
+        self.statistic = 0.0
+        self.mean = 0.0
+        self.variance = 0.0
+        self.slope = 0.0
+
+    def reset(self, stable_state):
+        super().reset(stable_state)
+        self.last_check = None
+        self.statistic = 0.0
+
+    def update(self, value):
+        now = self.clock()
+        r = value / self.STABLE_STATE - 1 if self.STABLE_STATE else 0.0
+        if self.last_update is None:
+            self.mean = r
+        elif now > self.last_update:
+            dt = now - self.last_update
+            alpha = min(1.0, dt / self.WINDOW)
+            delta = r - self.mean
+            self.mean += alpha * delta
+            self.variance = (1 - alpha) * (self.variance + alpha * delta * delta)
+            self.slope += alpha * ((r - self.relative) / dt - self.slope)
+        self.relative = r
+        self.last_update = now
+        self.value = value
+
+    def set_stable_state(self, stable_state):
+        super().set_stable_state(stable_state)
+        self.last_update = None  # Relative to the new baseline from now on
+
+    def check(self, avg):
+        now = self.clock()
+        self.crossed(avg, now)
+        self.STATE_CHANGING = self.FIRST_CROSSING is not None
+        if self.value is None or not self.STABLE_STATE:
+            return False
+        dt = now - self.last_check if self.last_check is not None else 0.0
+        self.last_check = now
+        self.statistic = max(0.0, self.statistic + (self.relative - self.DRIFT) * dt)
+        return self.statistic >= self.THRESHOLD
+
+    def describe(self):
+        return {"cusum": self.statistic, "mean": self.mean, "std": self.variance ** 0.5, "slope": self.slope}
+
+DETECTORS = {"threshold": ThresholdDetector, "cusum": ChangePointDetector}
+
+def make_detector(name="threshold", clock=time.time, **config):
+    if name not in DETECTORS:
+        raise ValueError("Unknown detector {0}, one of {1}".format(name, ", ".join(DETECTORS)))
+    return DETECTORS[name](clock=clock, **config)
+
+def add_detector_arguments(parser):
+    parser.add_argument("--detector", choices=list(DETECTORS), default="threshold")
+    parser.add_argument("--cusum-threshold", type=float, help="cusum: relative rise x seconds to detect")
+    parser.add_argument("--cusum-drift", type=float, help="cusum: relative rise ignored, default sensor repeatability")
+
+def detector_config_of(args):
+    """ Parameters given on the command line, defaults of the detector otherwise """
+    if args.detector != "cusum":
+        return {}
+    config = {"threshold": args.cusum_threshold, "drift": args.cusum_drift}
+    return {name: value for name, value in config.items() if value is not None}
@@ -0,0 +1,64 @@
+"""
+# Visual downsampling of long signals before plotting (whole nights in graph.py)
+#   minmax: min and max of each bucket in time order, every extreme kept
+#   lttb:   Largest-Triangle-Three-Buckets, one point per bucket, keeps the shape
+# Output size depends on the requested points only, not on the night length.
+"""
+import numpy as np
+
+METHODS = ("minmax", "lttb", "none")
+
+def minmax(x, y, n_buckets):
+    """ At most 2*n_buckets points, (x, y) unchanged if already that small """
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.asarray(x), y
+    size = -(-n // n_buckets)
+    full = n // size * size
+    rows = y[:full].reshape(-1, size)
+    starts = np.arange(0, full, size)
+    low = rows.argmin(axis=1) + starts
+    high = rows.argmax(axis=1) + starts
+    indices = np.column_stack((np.minimum(low, high), np.maximum(low, high))).ravel()
+    if full < n:    # Last partial bucket
+        tail = y[full:]
+        low, high = full + tail.argmin(), full + tail.argmax()
+        indices = np.concatenate((indices, [min(low, high), max(low, high)]))
+    return np.asarray(x)[indices], y[indices]
+
+def lttb(x, y, n_out):
+    """ n_out points, first and last kept, (x, y) unchanged if already that small """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64) # n_out - 2 buckets
+    edges = np.append(edges, n)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if end <= start:    # Fewer points than buckets left, keep in order
+            end = start + 1
+        next_start, next_end = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        # Twice the triangle areas (a, candidate, next bucket average)
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return x[indices], y[indices]
+
+def downsample(x, y, method, points):
+    """ method in METHODS, points is the output size budget for any method """
+    if method == "minmax":
+        return minmax(x, y, max(points // 2, 1))
+    if method == "lttb":
+        return lttb(x, y, points)
+    if method == "none":
+        return np.asarray(x), np.asarray(y)
+    raise ValueError("Unknown downsampling {0}, one of {1}".format(method, ", ".join(METHODS)))
@@ -0,0 +1,262 @@
+"""
+# TDI session engine: acquisition, processing, logging and protocol, no widgets
+# Runs under QCoreApplication (tdid.py, no display) or with the PlotWindow viewer (TDI.py)
+"""
+import sys
+import json
+import glob
+import time
+import queue
+from datetime import datetime
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from DEBUG_ENUM import DebugLevel
+from PHASES_ENUM import Phases
+from Datacollector import DataCollector
+from postprocess import PostProcessor
+from processing import SignalProcessor
+from processingthread import ProcessingThread
+from sessionlog import SessionLog, EVENT_TDI, EVENT_DROPPED, EVENT_OVERFLOW, EVENT_STATS
+from stagestats import StageStats, format_summary
+from checkpoint import checkpoint_path, load_checkpoint, save_checkpoint
+from startup import Prewarm, timer as startup_timer
+import serialframes
+
+def detect_ttys():
+    """ Every connected board, in a stable order """
+    return sorted(file for file in glob.glob('/dev/tty*') if 'ACM' in file)
+
+class TDIEngine(QObject):
+    phase_changed = pyqtSignal(int)     # Relayed for viewers
+    cycle_finished = pyqtSignal(int)
+
+    def __init__(self, debug_level=0, replay_file=None, is_live=True, window_values=None,
+                 keep_history=False, log_file=None, port=None, participant=None,
+                 postprocessor=None, prompt_bank=None, processing=None, detector="threshold",
+                 detector_config=None, resume=None):
+        """
+        port, participant: one engine per board in a multi participant session
+        postprocessor, prompt_bank, processing (SharedProcessingThread): shared
+        with the other engines of a SessionManager, owned by it. prompt_bank
+        is a PromptBank or a startup.Prewarm waited for at the first prompt.
+        Alone, the engine warms up its own audio, DUMMY and REPLAY import the
+        audio stack in the background but open no device and import no serial.
+        detector, detector_config: see detector.make_detector
+        resume: checkpoint (or its session log) of an interrupted session, its
+        log, participant, detector and cycle are continued, no calibration
+        """
+        super().__init__()
+        self.LIVE = is_live
+        self.DEBUG = debug_level
+        self.resumed = load_checkpoint(resume) if resume else None
+        if self.resumed:
+            log_file = self.resumed["log_file"]
+            participant = participant or self.resumed["participant"]
+            detector = self.resumed["detector_name"]
+            detector_config = self.resumed["detector_config"]
+        self.PARTICIPANT = participant
+        prefix = participant + "_" if participant else ""   # Per participant logs
+        self.LOG_FILE = log_file or "LOGS/" + prefix + str(datetime.now()).replace(" ", "_")
+        self.session_log = SessionLog(self.LOG_FILE)    # Appends to a resumed log
+        # Detector and protocol state, rewritten every CHECKPOINT_PERIOD and on phase changes
+        self.CHECKPOINT_FILE = checkpoint_path(self.LOG_FILE)
+        self.CHECKPOINT_PERIOD = 10 # seconds
+        self.checkpoint_timer = QTimer()
+        self.checkpoint_timer.timeout.connect(self.save_checkpoint)
+        self.detector_name = detector
+        self.detector_config = detector_config or {}
+        self.clock = time.time
+        self.START_TIME = None  # Set by start()
+
+        self.stepMS = 10    # 100 Hz sampling
+        self.N_VALUES = window_values or self.stepMS * 100
+        # Timing of every stage, written to the log every STATS_PERIOD
+        self.stats = StageStats()
+        self.STATS_PERIOD = 60 # seconds
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.log_stats)
+        # Filter, calibration and detection on every sample, in the processing thread
+        self.processor = SignalProcessor(self.session_log, self.N_VALUES,
+                                         detector_config=detector_config, is_live=is_live,
+                                         keep_history=keep_history, detector=detector, stats=self.stats)
+
+        self.BAUD_RATE = serialframes.BAUD_RATE
+        self.SERIAL_TIMEOUT = 0.05 # seconds, bounds a read when no frame arrives
+        self.port = port
+        self._serial_setup()
+
+        self.QUEUE_SIZE = 10000 # samples, 100 s at 100 Hz
+        self.sample_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        if processing is None:
+            self.processing_thread = ProcessingThread(self.processor, self.sample_queue)
+            self.processing_thread.phase_changed.connect(self.on_phase_changed)
+        else:
+            self.processing_thread = None
+            self.pipeline = processing.add(self.processor, self.sample_queue)
+            processing.phase_changed.connect(self.on_shared_phase_changed)
+
+        self.data_collector = DataCollector(self.ser, debug_level, self.sample_queue, replay_file, self.stats)
+        self.data_collector.frames_dropped.connect(self.log_dropped_frames)
+        self.data_collector.queue_overflow.connect(self.log_queue_overflow)
+
+        self.recorder = None    # Created at each detection
+        self.owns_audio = postprocessor is None
+        self.postprocessor = postprocessor if postprocessor else PostProcessor()
+        if self.owns_audio:  # Runs during the device check
+            prompt_bank = Prewarm(label=participant, devices=debug_level < DebugLevel.DUMMY)
+            prompt_bank.start()
+        self.prompt_source = prompt_bank
+        self.cycle = 0
+        if self.resumed:    # A cycle cut by the interruption counts as done
+            self.cycle = self.resumed["cycle"] + (1 if self.resumed["triggered"] else 0)
+        startup_timer.mark(self._label("engine ready"))
+        self.startup_timer = QTimer()
+        self.startup_timer.timeout.connect(self.report_startup)
+
+    @property
+    def prompt_bank(self):
+        if isinstance(self.prompt_source, Prewarm):
+            self.prompt_source = self.prompt_source.prompt_bank()
+        return self.prompt_source
+
+    def _label(self, name):
+        return self.PARTICIPANT + " " + name if self.PARTICIPANT else name
+
+    def report_startup(self):
+        """ Once the first sample is in and audio is warm """
+        warming = isinstance(self.prompt_source, Prewarm) and self.prompt_source.is_alive()
+        if self.data_collector.first_sample is None or warming:
+            return
+        self.startup_timer.stop()
+        startup_timer.mark(self._label("first sample"), self.data_collector.first_sample)
+        if startup_timer.claim_report():
+            print(startup_timer.report())
+
+    def start(self):
+        """ Calibration period starts now, or detection after grace when resuming """
+        self.START_TIME = self.clock()
+        if self.resumed and self.processor.resume(self.resumed, self.START_TIME):
+            self.START_TIME = self.processor.START_TIME
+            self.log_tdi("Resumed from checkpoint, cycle {0}, calibration average {1:.4f}".format(
+                self.cycle, self.processor.calibration_avg))
+        else:
+            self.processor.START_TIME = self.START_TIME
+        if self.processing_thread:
+            self.processing_thread.start()
+        self.data_collector.start()
+        self.stats_timer.start(self.STATS_PERIOD * 1000)
+        self.checkpoint_timer.start(self.CHECKPOINT_PERIOD * 1000)
+        self.startup_timer.start(100)
+        startup_timer.mark(self._label("acquisition started"))
+
+    def stop(self):
+        self.startup_timer.stop()
+        self.stats_timer.stop()
+        self.checkpoint_timer.stop()
+        self.data_collector.stop()
+        self.data_collector.wait()
+        if self.processing_thread:  # A shared one is stopped by its SessionManager first
+            self.processing_thread.stop()
+            self.processing_thread.wait()
+        self.log_stats()   # Last partial period
+        self.save_checkpoint(closed=True)
+        print("Closing session log " + self.LOG_FILE)
+        self.session_log.close()
+        if self.owns_audio:
+            print("Waiting for recording post-processing")
+            self.postprocessor.shutdown()
+            self.close_prompt_bank(self.prompt_bank)
+
+    @staticmethod
+    def close_prompt_bank(prompt_bank):
+        if prompt_bank:
+            for name, (plays, mean, worst) in prompt_bank.latency_report().items():
+                print("{0}: {1} plays, latency mean {2:.1f} ms, max {3:.1f} ms".format(
+                    name, plays, mean * 1000, worst * 1000))
+            prompt_bank.close()
+
+    def set_recorder(self):
+        from recorder import Recorder   # Audio stack, already imported if warmed up
+        self.recorder = Recorder(self.cycle, self.postprocessor, self.prompt_bank,
+                                 participant=self.PARTICIPANT)
+        self.recorder.finished_signal.connect(self.reset_trigger)
+        self.recorder.log_send.connect(self.log_tdi)
+
+    def log_dropped_frames(self, total_dropped):
+        self.session_log.log_event(self.clock(), EVENT_DROPPED, total_dropped)
+
+    def log_queue_overflow(self, total_lost):
+        print("Processing stalled, {0} samples lost".format(total_lost))
+        self.session_log.log_event(self.clock(), EVENT_OVERFLOW, total_lost)
+
+    def save_checkpoint(self, closed=False):
+        """ closed: stopped cleanly, still resumable by name but not picked as latest """
+        state = self.processor.checkpoint_state()
+        state.update(log_file=self.LOG_FILE, participant=self.PARTICIPANT, cycle=self.cycle,
+                     detector_name=self.detector_name, detector_config=self.detector_config,
+                     saved_at=self.clock(), closed=closed)
+        try:
+            save_checkpoint(self.CHECKPOINT_FILE, state)
+        except OSError as error:    # Never stops the night
+            print("Checkpoint not written: {0}".format(error))
+
+    def log_stats(self):
+        report = self.stats.report()
+        self.session_log.log_event(self.clock(), EVENT_STATS, json.dumps(report, separators=(",", ":")))
+        if self.DEBUG >= DebugLevel.BASIC:
+            print(format_summary(report))
+
+    def log_tdi(self, log_record):
+        self.session_log.log_event(self.clock(), EVENT_TDI, log_record)
+
+    def reset_trigger(self):    # Called on Recorder termination
+        self.cycle_finished.emit(self.cycle)
+        self.cycle += 1
+        self.processor.rearm()
+        self.save_checkpoint()
+
+    def on_phase_changed(self, phase):    # From the processing thread
+        self.save_checkpoint()
+        if phase == Phases.DETECTED:
+            self.triggered()
+        self.phase_changed.emit(phase)
+
+    def on_shared_phase_changed(self, pipeline, phase):
+        if pipeline == self.pipeline:
+            self.on_phase_changed(phase)
+
+    def triggered(self):    # TDI PROTOCOL
+        print(self.processor.PHASE)
+        latency = self.processor.decision_latency
+        if latency is not None:
+            print("Decided {0:.1f} s after the first threshold crossing".format(latency))
+        print("Starting prompting/recording phase...")
+        self.set_recorder()
+        self.recorder.start()
+
+    def _serial_setup(self, ):
+        if self.DEBUG >= DebugLevel.DUMMY:
+            self.port = None
+            self.ser = None
+        else:
+            import serial   # pyserial, board sessions only
+            self.port = self.port or self._detect_tty()
+            self.ser = serial.Serial(self.port, self.BAUD_RATE, timeout=self.SERIAL_TIMEOUT)
+            try: # Test readable
+                _ = self.ser.read(serialframes.FRAME_SIZE)
+                self.ser.reset_input_buffer()   # Start on fresh samples, not a backlog
+            except PermissionError:
+                print(f"Permission error when reading from serial {self.port} \
+                      run './serial_setup.sh'")
+                sys.exit(1)
+
+    @staticmethod
+    def _detect_tty():
+        acm_files = detect_ttys()
+        if acm_files:
+            port = acm_files[0]
+        else:
+            print("No tty available !")
+            port = None
+        return port
@@ -1,54 +1,159 @@
-import sounddevice as sd
-import noisereduce as nr
-import numpy as np
-import wave
+"""
+# Record the protocol prompts, denoise, normalise loudness and pre-render
+# them at the output device rate into recorded_prompts/
+# Recording the next prompt overlaps with processing the previous ones (worker
+# processes). Takes and processed prompts are cached by text and language (and
+# settings), so changing the word or a setting only redoes what changed.
+# Usage: python makePrompts.py [--lang fr] [--word Arbres] [--name Alice] [--force]
+"""
 import os
+import sys
+import json
+import time
+import wave
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import sounddevice as sd
+
+from postprocess import read_wav, trim_silence, dbfs
 
-def record_audio(duration, sample_rate=44100):
+PROMPTS = {
+        'en': ("Trees",
+               ["{name}, You are falling asleep",
+                "Please tell me what is going on through your mind ?",
+                "Remember to think of {word}",
+                "You can fall back asleep now, close your hand on the glove again",
+                "You can wake up fully"]),
+        'fr': ("Arbres",
+               ["{name}, tu t'endors",
+                "Dis moi, que te passe il par la tete ?",
+                "N'oublie pas de penser aux {word}",
+                "Tu peu te rendormir maintenant, referme ta main sur le gant",
+                "Tu peu te réveiller complètement"]),
+        }
+RECORD_RATE = 44100
+REDUCTION_STRENGTH = 0.95
+LOUDNESS_DBFS = -20 # Speech RMS target, same level for every prompt
+PEAK_DBFS = -1
+
+def record_audio(duration, sample_rate=RECORD_RATE):
     print("Recording...")
     audio_data = sd.rec(int(duration * sample_rate), samplerate=sample_rate, channels=1, dtype='int16')
     sd.wait()
     print("Recording complete.")
     return audio_data.flatten()
 
-def save_audio(audio_signal, output_file, sample_rate=44100):
-    with wave.open(output_file, 'w') as wf:
+def save_audio(audio_signal, output_file, sample_rate=RECORD_RATE):
+    """ Written next to the target then renamed, never a half written prompt """
+    tmp = output_file + ".tmp"
+    with wave.open(tmp, 'w') as wf:
         wf.setnchannels(1)  # Mono audio
         wf.setsampwidth(2)  # 2 bytes per sample for int16 data type
         wf.setframerate(sample_rate)
         wf.writeframes(audio_signal.tobytes())
+    os.replace(tmp, output_file)
+
+def cache_key(*parts):
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def normalise(audio, loudness_dbfs=LOUDNESS_DBFS, peak_dbfs=PEAK_DBFS):
+    """ Speech RMS to loudness_dbfs, scaled down if the peak would exceed peak_dbfs """
+    audio = audio.astype(np.float64)
+    rms = np.sqrt(np.mean(audio ** 2)) if len(audio) else 0.0
+    if rms == 0:
+        return audio
+    gain = 10 ** ((loudness_dbfs - dbfs(rms)) / 20)
+    peak = np.max(np.abs(audio)) * gain
+    peak_max = 32768 * 10 ** (peak_dbfs / 20)
+    if peak > peak_max:
+        gain *= peak_max / peak
+    return audio * gain
+
+def process_prompt(take_file, output_file, output_rate, reduction_strength, loudness_dbfs):
+    """ Worker side: denoise, trim, normalise, resample to the output rate """
+    import noisereduce as nr
+    from scipy.signal import resample_poly
+    audio, sample_rate = read_wav(take_file)
+    denoised = nr.reduce_noise(y=audio.astype(np.float32), sr=sample_rate, prop_decrease=reduction_strength)
+    start, end = trim_silence(np.clip(denoised, -32768, 32767).astype(np.int16), sample_rate)
+    if end <= start:    # Muted or unplugged mic, never cache an empty prompt
+        raise ValueError("no speech in {0}".format(take_file))
+    speech = normalise(denoised[start:end], loudness_dbfs)
+    if output_rate != sample_rate:
+        common = np.gcd(output_rate, sample_rate)
+        speech = resample_poly(speech, output_rate // common, sample_rate // common)
+    speech = np.clip(np.round(speech), -32768, 32767).astype(np.int16)
+    save_audio(speech, output_file, output_rate)
+    return output_file
+
+def _lower_priority():
+    if hasattr(os, "nice"):
+        os.nice(5)  # Keep the recording responsive
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and prepare the protocol prompts")
+    parser.add_argument("--lang", choices=sorted(PROMPTS), default="en")
+    parser.add_argument("--word", help="word to think of, default per language")
+    parser.add_argument("--name", default="[Your NAME]", help="participant name in prompt 1")
+    parser.add_argument("--output", default="recorded_prompts")
+    parser.add_argument("--duration", type=float, default=10, help="seconds recorded per prompt")
+    parser.add_argument("--reduction", type=float, default=REDUCTION_STRENGTH)
+    parser.add_argument("--loudness", type=float, default=LOUDNESS_DBFS, help="speech RMS, dBFS")
+    parser.add_argument("--rate", type=int, help="output sample rate, default the output device rate")
+    parser.add_argument("--cache-dir", default=".prompt_cache")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="record every prompt again")
+    args = parser.parse_args()
+
+    word, templates = PROMPTS[args.lang]
+    word = args.word or word
+    output_rate = args.rate or int(sd.query_devices(None, 'output')['default_samplerate'])
+    os.makedirs(args.output, exist_ok=True)
+    os.makedirs(args.cache_dir, exist_ok=True)
+    start = time.time()
+
+    pending = []
+    # Spawn, workers only import this module's functions
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_lower_priority,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        for i, template in enumerate(templates):
+            text = template.format(name=args.name, word=word)
+            take_file = os.path.join(args.cache_dir, "take_{0}.wav".format(cache_key(args.lang, text)))
+            prompt_file = os.path.join(args.cache_dir, "prompt_{0}.wav".format(cache_key(
+                    args.lang, text, args.reduction, args.loudness, output_rate)))
+            future = None
+            if os.path.exists(prompt_file) and not args.force:
+                print(f"\t\tPrompt {i + 1}: {text} (cached)")
+            else:
+                if args.force or not os.path.exists(take_file):
+                    print(f"\t\tPrompt {i + 1}: {text}")
+                    save_audio(record_audio(args.duration), take_file)
+                # Processed while the next prompt is recorded
+                future = pool.submit(process_prompt, take_file, prompt_file, output_rate,
+                                     args.reduction, args.loudness)
+            pending.append((i, prompt_file, future, take_file))
+        failed = []
+        for i, prompt_file, future, take_file in pending:
+            if future:
+                try:
+                    future.result()
+                except ValueError as error:
+                    os.remove(take_file)    # Recorded again on the next run
+                    print("Prompt {0} not saved: {1}, run again to record it".format(i + 1, error))
+                    failed.append(i + 1)
+                    continue
+            output_file = os.path.join(args.output, f'prompt_{i + 1}.wav')
+            shutil.copyfile(prompt_file, output_file)
+            print(f"Prompt saved to {output_file}")
+    if failed:
+        print("Prompts {0} to record again".format(", ".join(map(str, failed))))
+        return 1
+    print("All prompts ready at {0} Hz in {1:.1f} s".format(output_rate, time.time() - start))
 
-def record_and_save(prompt, output_folder, index, duration=5, reduction_strength=0.95):
-    print(f"\t\tPrompt {index + 1}: {prompt}")
-    audio_signal = record_audio(duration)
-    denoised_audio = nr.reduce_noise(
-        y=audio_signal,
-        sr=44100, 
-        prop_decrease=reduction_strength
-    )
-    output_file = os.path.join(output_folder, f'prompt_{index + 1}.wav')
-    save_audio(denoised_audio, output_file)
-    print(f"Denoised audio saved to {output_file}")
-#----------------------------------------
-record_duration = 10 # seconds
-output_folder = 'recorded_prompts'
-os.makedirs(output_folder, exist_ok=True)
-
-prompt = "Trees"
-prompts = ["[Your NAME], You are falling asleep",
-           "Please tell me what is going on through your mind ?",
-           "Remember to think of {0}".format(prompt),
-           "You can fall back asleep now, close your hand on the glove again",
-           "You can wake up fully"]
-
-## Comment or uncomment based on language going to be used
-# prompt = "Arbres"
-# prompts = ["[Votre NOM], tu t'endors",
-#            "Dis moi, que te passe il par la tete ?",
-#            "N'oublie pas de penser aux {0}".format(prompt),
-#            "Tu peu te rendormir maintenant, referme ta main sur le gant",
-#            "Tu peu te réveiller complètement"]
-
-for i, prompt in enumerate(prompts):
-    record_and_save(prompt, output_folder, i, record_duration)
-print("All prompts recorded and saved.")
+if __name__ == '__main__':
+    sys.exit(main())
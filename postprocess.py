@@ -0,0 +1,162 @@
+"""
+# Background post-processing of cycle recordings (REC/)
+# Denoise, trim leading/trailing silence, compress to FLAC and write a
+# .json sidecar with duration and level stats, in worker processes.
+# Usage (existing folder): python postprocess.py REC/ [--workers N] [--force]
+"""
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+REDUCTION_STRENGTH = 0.95   # Same as makePrompts.py
+SILENCE_THRESHOLD_DB = -45  # dBFS, frame RMS below is silence
+FRAME_MS = 20
+PAD_MS = 250    # Silence kept around the speech
+
+def read_wav(path):
+    with wave.open(path, 'rb') as wf:
+        sample_rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+    return np.frombuffer(frames, dtype=np.int16), sample_rate
+
+def dbfs(rms):
+    return 20 * np.log10(max(rms, 1e-9) / 32768)
+
+def trim_silence(audio, sample_rate, threshold_db=SILENCE_THRESHOLD_DB, frame_ms=FRAME_MS, pad_ms=PAD_MS):
+    """ Returns (start, end) sample bounds of the non silent part """
+    frame = max(int(sample_rate * frame_ms / 1000), 1)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return 0, len(audio)
+    frames = audio[:n_frames * frame].astype(np.float64).reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    loud = np.flatnonzero(rms >= 32768 * 10 ** (threshold_db / 20))
+    if len(loud) == 0:
+        return 0, 0
+    pad = int(sample_rate * pad_ms / 1000)
+    start = max(loud[0] * frame - pad, 0)
+    end = min((loud[-1] + 1) * frame + pad, len(audio))
+    return start, end
+
+def process_recording(path, reduction_strength=REDUCTION_STRENGTH, threshold_db=SILENCE_THRESHOLD_DB):
+    """ Worker side, returns the sidecar stats dict """
+    import noisereduce as nr
+    import soundfile as sf
+    started = time.time()
+    audio, sample_rate = read_wav(path)
+    denoised = nr.reduce_noise(y=audio.astype(np.float32), sr=sample_rate, prop_decrease=reduction_strength)
+    denoised = np.clip(np.round(denoised), -32768, 32767).astype(np.int16)
+    start, end = trim_silence(denoised, sample_rate, threshold_db)
+    silent = bool(end <= start)
+    if silent:  # Nothing above the threshold, keep it all rather than an empty file
+        start, end = 0, len(denoised)
+    trimmed = denoised[start:end]
+    sf.write(path + ".flac", trimmed, sample_rate, format='FLAC', subtype='PCM_16')
+
+    rms = float(np.sqrt(np.mean(trimmed.astype(np.float64) ** 2))) if len(trimmed) else 0.0
+    stats = {
+            "source": os.path.basename(path),
+            "sample_rate": sample_rate,
+            "duration": len(audio) / sample_rate,
+            "trimmed_duration": len(trimmed) / sample_rate,
+            "silent": silent,
+            "speech_start": start / sample_rate,
+            "speech_end": end / sample_rate,
+            "rms": rms,
+            "rms_dbfs": float(dbfs(rms)),
+            "peak": int(np.max(np.abs(trimmed.astype(np.int32)))) if len(trimmed) else 0,
+            "processing_time": time.time() - started,
+            }
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=1)
+    return stats
+
+def _lower_priority():
+    if hasattr(os, "nice"):
+        os.nice(10) # Never compete with acquisition or prompting
+
+class PostProcessor:
+    """
+    Fed by the Recorder with each saved recording, submit() returns at once
+    so the next cycle never waits on processing
+    """
+    def __init__(self, workers=1, reduction_strength=REDUCTION_STRENGTH):
+        self.reduction_strength = reduction_strength
+        # Spawn, a forked Qt process is not safe
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_lower_priority,
+                                        mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, path):
+        future = self.pool.submit(process_recording, path, self.reduction_strength)
+        future.add_done_callback(lambda done: self._done(path, done))
+        return future
+
+    @staticmethod
+    def _done(path, future):
+        try:
+            stats = future.result()
+            print("Post-processed {0}: {1:.1f} s speech of {2:.1f} s".format(
+                path, stats["trimmed_duration"], stats["duration"]))
+        except Exception as error: # Keep the raw WAV, report and go on
+            print("Post-processing failed for {0}: {1}".format(path, error))
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+#----------------------------------------
+def is_wav(path):
+    try:
+        with open(path, "rb") as f:
+            header = f.read(12)
+    except OSError:
+        return False
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+def find_recordings(folder, force=False):
+    """ WAV files (Recorder names them without extension) not yet processed """
+    recordings = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name.endswith((".flac", ".json")) or not os.path.isfile(path) or not is_wav(path):
+            continue
+        done = os.path.exists(path + ".flac") and os.path.getmtime(path + ".flac") >= os.path.getmtime(path)
+        if force or not done:
+            recordings.append(path)
+    return recordings
+
+def main():
+    parser = argparse.ArgumentParser(description="Post-process cycle recordings in a REC folder")
+    parser.add_argument("folder", nargs="?", default="REC")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="also redo already processed recordings")
+    args = parser.parse_args()
+
+    recordings = find_recordings(args.folder, args.force)
+    print("{0} recordings to process".format(len(recordings)))
+    start = time.time()
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(process_recording, path): path for path in recordings}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                stats = future.result()
+            except Exception as error: # Keep the raw WAV, report and go on
+                print("{0}: failed, {1}".format(path, error))
+                failed.append(path)
+                continue
+            print("{0}: {1:.1f} s -> {2:.1f} s, {3:.1f} dBFS{4}".format(
+                path, stats["duration"], stats["trimmed_duration"], stats["rms_dbfs"],
+                ", no speech found, kept whole" if stats["silent"] else ""))
+    print("Done in {0:.1f} s, {1} failed".format(time.time() - start, len(failed)))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+# Per sample signal processing: filter, window average, calibration, trigger detection
+# No Qt dependency: used live (processingthread.py) and by the headless replay
+"""
+import threading
+from time import perf_counter
+
+import numpy as np
+from OneEuroFilter import OneEuroFilter
+
+from PHASES_ENUM import Phases
+from detector import make_detector
+from ringbuffer import RingBuffer
+from pyramid import MinMaxPyramid
+from sessionlog import EVENT_PHASE, EVENT_CAL_AVG, EVENT_DETECTOR
+
+FILTER_CONFIG = {
+        'freq': 100,       # Hz
+        'mincutoff': 1.0,  # Hz
+        'beta': 0.1,
+        'dcutoff': 1.0
+        }
+WINDOW_VALUES = 1000
+CALIBRATION_PERIOD = 90 # 1.5 min
+
+class SignalProcessor:
+    """
+    Clock of the detector is the timestamp of the sample being processed,
+    so detection timing is exact per sample whatever the consumer latency.
+    detector: name in detector.DETECTORS, detector_config its parameters
+    stats (stagestats.StageStats): per sample timing of process, filter and detector
+    """
+    def __init__(self, session_log=None, window_values=WINDOW_VALUES, calibration_period=CALIBRATION_PERIOD,
+                 filter_config=None, detector_config=None, start_time=None, is_live=True, keep_history=False,
+                 detector="threshold", stats=None):
+        self.LIVE = is_live
+        self.stats = stats
+        self.session_log = session_log
+        self.PHASE = Phases.CALIBRATION
+        self.now = 0.0
+        self.START_TIME = start_time   # None: first sample
+        self.CALIBRATION_PERIOD = calibration_period
+        self.detector = make_detector(detector, clock=self.clock, **(detector_config or {}))
+        self.calibration_total = 0
+        self.calibration_avg_count = 0
+        self.calibration_avg = 0
+        self.filter = OneEuroFilter(**(filter_config or FILTER_CONFIG))
+        self.total_data_count = 0
+        self.N_VALUES = window_values
+        self.data_y = RingBuffer(self.N_VALUES)
+        self.data_y_raw = RingBuffer(self.N_VALUES)
+        self.avg_last_sec = 0
+        self.history = MinMaxPyramid() if keep_history else None # Whole night overview
+        self.TRIGGERED = False
+        self.decision_latency = None    # Of the last detection, see log_decision
+        self._lock = threading.Lock()   # Processing thread vs GUI snapshot/rearm
+
+    def clock(self):
+        return self.now
+
+    def process(self, value, timestamp):
+        """ Returns the new phase when this sample changes it, else None """
+        if self.stats is None:
+            with self._lock:
+                return self._process(value, timestamp)
+        start = perf_counter()
+        with self._lock:    # Waiting for a GUI snapshot counts
+            phase = self._process(value, timestamp)
+        self.stats.record("process", perf_counter() - start)
+        return phase
+
+    def _process(self, value, timestamp):
+        self.now = timestamp
+        if self.START_TIME is None:
+            self.START_TIME = timestamp
+        self.update_data(value)
+        if self.PHASE == Phases.CALIBRATION:
+            if timestamp - self.START_TIME >= self.CALIBRATION_PERIOD:
+                self.detector.set_stable_state(self.calibration_avg)
+                self.set_phase(Phases.RUNNING)
+                if self.session_log:
+                    self.session_log.log_event(timestamp, EVENT_CAL_AVG, self.calibration_avg)
+                return Phases.RUNNING
+            # Running average update
+            self.calibration_total += value
+            self.calibration_avg_count += 1
+            self.calibration_avg = self.calibration_total / self.calibration_avg_count
+            return None
+        return self.check_for_trigger()
+
+    def update_data(self, value):
+        if self.stats is None:
+            filtered_value = self.filter(value, 0.001 * self.total_data_count)
+        else:
+            start = perf_counter()
+            filtered_value = self.filter(value, 0.001 * self.total_data_count)
+            self.stats.record("filter", perf_counter() - start)
+        self.data_y_raw.append(value)
+        self.data_y.append(filtered_value)
+        self.avg_last_sec = self.data_y.mean()    # O(1) running mean
+        self.total_data_count += 1
+        if self.PHASE != Phases.CALIBRATION:
+            self.detector.update(filtered_value)
+        if self.history is not None:
+            self.history.append(filtered_value)
+        if self.session_log: # Log raw values to be able to replay filtering differently
+            self.session_log.append_sample(self.now, value)
+
+    def check_for_trigger(self):
+        """ See ThresholdDetector.check for the detection state machine """
+        GRACE = self.detector.update_grace()
+        if not self.LIVE:
+            return None # Ignore checking when dry run
+        if self.TRIGGERED:
+            return None # Ignore checking if already in triggered state
+        if GRACE:
+            return None # After closing hand again small grace period of checking
+        if self.stats is None:
+            detected = self.detector.check(self.avg_last_sec)
+        else:
+            start = perf_counter()
+            detected = self.detector.check(self.avg_last_sec)
+            self.stats.record("detector", perf_counter() - start)
+        if detected:
+            self.TRIGGERED = True
+            self.log_decision()
+            self.set_phase(Phases.DETECTED)
+            return Phases.DETECTED
+        return None
+
+    def log_decision(self):
+        """ Latency none: detected before the 1 s average crossed the bound """
+        latency = self.detector.decision_latency()
+        self.decision_latency = latency
+        if self.session_log:
+            state = " ".join("{0}={1:.5g}".format(name, value) for name, value in self.detector.describe().items())
+            self.session_log.log_event(self.now, EVENT_DETECTOR, "{0} latency={1} {2}".format(
+                type(self.detector).__name__, "none" if latency is None else "{0:.2f}".format(latency), state))
+
+    def set_phase(self, phase):
+        self.PHASE = phase
+        if self.session_log:
+            self.session_log.log_event(self.now, EVENT_PHASE, phase.name)
+
+    def checkpoint_state(self):
+        """ Calibration and detector baseline, see resume """
+        with self._lock:
+            return {"phase": self.PHASE.name, "triggered": self.TRIGGERED, "start_time": self.START_TIME,
+                    "calibration_avg": self.calibration_avg, "calibration_count": self.calibration_avg_count,
+                    "samples": self.total_data_count, "detector": self.detector.state()}
+
+    def resume(self, state, now):
+        """
+        Calibrated state of a checkpoint: no calibration period, detection
+        restarts from the calibration baseline after a grace period since
+        the signal during the interruption is unknown.
+        now: time of the first sample to come, start of the grace period.
+        Returns False (nothing restored) if the checkpoint predates calibration.
+        """
+        if state["phase"] == Phases.CALIBRATION.name:
+            return False
+        with self._lock:
+            self.START_TIME = state["start_time"]
+            self.calibration_avg = state["calibration_avg"]
+            self.calibration_avg_count = state["calibration_count"]
+            self.calibration_total = self.calibration_avg * self.calibration_avg_count
+            self.detector.restore(state["detector"])
+            self.PHASE = Phases.RUNNING
+            self.now = now
+        self.rearm()
+        return True
+
+    def rearm(self):    # Protocol finished, detect again after grace
+        with self._lock:
+            self.detector.reset(self.calibration_avg)
+            self.TRIGGERED = False
+
+    def snapshot(self, max_points=None):
+        """ Copies of (filtered, raw) windows, decimated to at most max_points """
+        with self._lock:
+            step = 1 if not max_points else max(1, -(-self.N_VALUES // max_points))
+            return (np.array(self.data_y.view()[::step]), np.array(self.data_y_raw.view()[::step]),
+                    self.avg_last_sec, self.PHASE, self.TRIGGERED)
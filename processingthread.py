@@ -0,0 +1,72 @@
+"""
+# Processing thread, runs SignalProcessor on every sample queued by DataCollector
+"""
+import time
+import queue
+from PyQt5.QtCore import QThread, pyqtSignal
+
+class ProcessingThread(QThread):
+    """ Consumes (timestamp, value) samples from the acquisition queue """
+    phase_changed = pyqtSignal(int)
+
+    def __init__(self, processor, sample_queue, parent=None):
+        super().__init__(parent)
+        self._stop = False
+        self.processor = processor
+        self.sample_queue = sample_queue
+
+    def run(self):
+        while not self._stop:
+            try:
+                timestamp, value = self.sample_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            phase = self.processor.process(value, timestamp)
+            if self.processor.stats is not None:    # Acquisition to processed
+                self.processor.stats.record("queue_latency", time.time() - timestamp)
+            if phase is not None:
+                self.phase_changed.emit(int(phase))
+
+    def stop(self):
+        self._stop = True
+
+class SharedProcessingThread(QThread):
+    """
+    One thread for every pipeline of a multi participant session: drains each
+    acquisition queue in turn, sleeps only when all are empty. Keeps the thread
+    count and wakeups flat whatever the number of participants.
+    """
+    phase_changed = pyqtSignal(int, int)  # Pipeline index, phase
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._stop = False
+        self.pipelines = []
+        self.MAX_BATCH = 100    # samples per queue per pass, fairness between participants
+        self.IDLE_MS = 5
+
+    def add(self, processor, sample_queue):
+        """ Before start(), returns the pipeline index used in phase_changed """
+        self.pipelines.append((processor, sample_queue))
+        return len(self.pipelines) - 1
+
+    def run(self):
+        while not self._stop:
+            busy = False
+            for index, (processor, sample_queue) in enumerate(self.pipelines):
+                for _ in range(self.MAX_BATCH):
+                    try:
+                        timestamp, value = sample_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    busy = True
+                    phase = processor.process(value, timestamp)
+                    if processor.stats is not None:
+                        processor.stats.record("queue_latency", time.time() - timestamp)
+                    if phase is not None:
+                        self.phase_changed.emit(index, int(phase))
+            if not busy:
+                self.msleep(self.IDLE_MS)
+
+    def stop(self):
+        self._stop = True
@@ -0,0 +1,62 @@
+"""
+# Prompt bank: all prompts decoded once at session start, played on a
+# persistent pre-opened output stream (no per prompt decode or player start)
+"""
+import os
+import time
+import threading
+
+import numpy as np
+import sounddevice as sd
+from pydub import AudioSegment
+
+PROMPT_NAMES = ["prompt_{0}".format(index) for index in range(1, 6)]
+
+class PromptBank:
+    BLOCK_SIZE = 256    # frames, first block written alone to time the start
+
+    def __init__(self, sound_dir='recorded_prompts/', device=None, samplerate=None, latency='low'):
+        self.sound_dir = sound_dir
+        self.device = device
+        self.samplerate = samplerate or int(sd.query_devices(device, 'output')['default_samplerate'])
+        self.prompts = {}
+        for name in PROMPT_NAMES:
+            path = os.path.join(sound_dir, name + '.wav')
+            if os.path.exists(path):
+                self.prompts[name] = self._decode(path)
+        self.latencies = {name: [] for name in self.prompts}
+        self._lock = threading.Lock()   # Recorders sharing this device play in turn
+        self.stream = sd.OutputStream(samplerate=self.samplerate, channels=1, dtype='int16',
+                                      device=device, latency=latency)
+        self.stream.start()
+
+    def _decode(self, path):
+        """ Mono int16 PCM at the output rate, converted here not at play time """
+        sound = AudioSegment.from_file(path, format='wav')
+        sound = sound.set_channels(1).set_sample_width(2).set_frame_rate(self.samplerate)
+        return np.frombuffer(sound.raw_data, dtype=np.int16).reshape(-1, 1)
+
+    def play(self, name):
+        """
+        Blocks until the prompt has been heard (like pydub play)
+        Returns trigger to audio latency in seconds: time to queue the first
+        block plus the output latency reported by the device
+        """
+        data = self.prompts[name]
+        triggered = time.perf_counter()
+        with self._lock:
+            self.stream.write(data[:self.BLOCK_SIZE])
+            latency = time.perf_counter() - triggered + self.stream.latency
+            self.stream.write(data[self.BLOCK_SIZE:])
+            time.sleep(self.stream.latency)  # Last block still in the device buffer
+            self.latencies[name].append(latency)
+        return latency
+
+    def latency_report(self):
+        """ name: (plays, mean s, max s) """
+        return {name: (len(values), float(np.mean(values)), float(np.max(values)))
+                for name, values in self.latencies.items() if values}
+
+    def close(self):
+        self.stream.stop()
+        self.stream.close()
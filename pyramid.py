@@ -0,0 +1,104 @@
+"""
+# Multi-resolution min/max pyramid of a growing signal (whole night overview)
+"""
+import threading
+
+import numpy as np
+
+class _Level:
+    """ Growable min/max arrays, doubled when full (amortised O(1) append) """
+    def __init__(self, capacity):
+        self.mins = np.empty(capacity, dtype=np.float32)
+        self.maxs = np.empty(capacity, dtype=np.float32)
+        self.count = 0
+        # Group being built for the next level
+        self.group_min = float("inf")
+        self.group_max = float("-inf")
+        self.group_count = 0
+
+    def append(self, low, high):
+        if self.count == len(self.mins):
+            self.mins = np.concatenate((self.mins, np.empty_like(self.mins)))
+            self.maxs = np.concatenate((self.maxs, np.empty_like(self.maxs)))
+        self.mins[self.count] = low
+        self.maxs[self.count] = high
+        self.count += 1
+
+class MinMaxPyramid:
+    """
+    Level 0 holds min/max per `block` samples, each next level merges
+    `factor` buckets of the previous one. append() is O(1) amortised,
+    query() picks the coarsest level still giving max_points buckets.
+    The last incomplete block is not shown.
+    """
+    def __init__(self, block=10, factor=4, n_levels=8, capacity=1024):
+        self.block = block
+        self.factor = factor
+        self.levels = [_Level(capacity) for _ in range(n_levels)]
+        self.count = 0
+        self._block_min = float("inf")
+        self._block_max = float("-inf")
+        self._block_count = 0
+        self._lock = threading.Lock()
+
+    def append(self, value):
+        if value < self._block_min:
+            self._block_min = value
+        if value > self._block_max:
+            self._block_max = value
+        self._block_count += 1
+        self.count += 1
+        if self._block_count == self.block:
+            with self._lock:
+                self._push(0, self._block_min, self._block_max)
+            self._block_min = float("inf")
+            self._block_max = float("-inf")
+            self._block_count = 0
+
+    def _push(self, index, low, high):
+        while True:
+            level = self.levels[index]
+            level.append(low, high)
+            index += 1
+            if index == len(self.levels):
+                return
+            level.group_min = min(level.group_min, low)
+            level.group_max = max(level.group_max, high)
+            level.group_count += 1
+            if level.group_count < self.factor:
+                return
+            low, high = level.group_min, level.group_max
+            level.group_min = float("inf")
+            level.group_max = float("-inf")
+            level.group_count = 0
+
+    def bucket_size(self, index):
+        return self.block * self.factor ** index
+
+    def query(self, start=0, end=None, max_points=1000):
+        """
+        Returns (first sample index of each bucket, mins, maxs) for samples
+        in [start, end), copies safe to hand to the GUI thread
+        """
+        end = self.count if end is None else min(end, self.count)
+        start = max(start, 0)
+        span = max(end - start, 1)
+        index = 0
+        while index < len(self.levels) - 1 and span / self.bucket_size(index) > max_points:
+            index += 1
+        bucket = self.bucket_size(index)
+        with self._lock:
+            level = self.levels[index]
+            first = start // bucket
+            last = min(-(-end // bucket), level.count)
+            if last <= first:
+                empty = np.zeros(0, dtype=np.float32)
+                return np.zeros(0, dtype=np.int64), empty, empty
+            return (np.arange(first, last) * bucket, level.mins[first:last].copy(),
+                    level.maxs[first:last].copy())
+
+def envelope(indices, mins, maxs):
+    """ x, y of a single line drawing each bucket as a min to max segment """
+    x = np.repeat(indices, 2)
+    y = np.column_stack((mins, maxs)).ravel()
+    return x, y
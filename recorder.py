@@ -1,5 +1,6 @@
 import sounddevice as sd
 import time
+import queue
 import numpy as np
 import wave
 import os
@@ -14,59 +15,100 @@ class Recorder(QThread):
     finished_signal = pyqtSignal()
     log_send = pyqtSignal(str)
 
-    def __init__(self, cycle, parent=None):
+    def __init__(self, cycle, postprocessor=None, prompt_bank=None, max_duration=60,
+                 silence_duration=10, vad_threshold_db=-45, participant=None, parent=None):
         super().__init__(parent)
-        self.output_folder = 'REC/' + str(datetime.now()).replace(" ", "_")
+        self.postprocessor = postprocessor # Optional background denoise/FLAC stage
+        self.prompt_bank = prompt_bank # Preloaded prompts on an open output stream
+        prefix = participant + "_" if participant else ""  # Per participant recordings
+        self.output_folder = 'REC/' + prefix + str(datetime.now()).replace(" ", "_")
         self.soundDir = 'recorded_prompts/'
         self.cycle = cycle
         self.MAX_CYCLE = 2
+        self.MAX_DURATION = max_duration            # seconds, answer upper bound
+        self.SILENCE_DURATION = silence_duration    # seconds of silence ending the answer
+        self.VAD_THRESHOLD_DB = vad_threshold_db    # block RMS in dBFS counted as voice
+        self.BLOCK_DURATION = 0.1                   # seconds per block written to disk
 
     def run(self):
         print("Allowing 3 min of sleep...")
         self.log_send.emit("Sleep period")
         time.sleep(60*3)    # Sleep for predefined amount
 
-        sound = AudioSegment.from_file(self.soundDir + 'prompt_1.wav', format='wav')
-        play(sound) # "[Name] You are falling asleep"
+        self.play_prompt('prompt_1') # "[Name] You are falling asleep"
         self.log_send.emit("Prompt 1")
 
-        sound = AudioSegment.from_file(self.soundDir + 'prompt_2.wav', format='wav')
-        play(sound) # "Please tell me what is going on through your mind ?"
+        self.play_prompt('prompt_2') # "Please tell me what is going on through your mind ?"
         self.log_send.emit("Prompt 2")
         filename = "cycle_" + str(self.cycle)
         output_file = self.output_folder + filename
-        duration = 60
         self.log_send.emit("Recording...")
-        response = self.record_audio(duration)
-        self.save_audio(response, output_file)
-        self.log_send.emit("Saving audio...")
+        duration = self.record_audio(output_file, self.MAX_DURATION)
+        self.log_send.emit("Recorded {0:.1f} s".format(duration))
+        if self.postprocessor:
+            self.postprocessor.submit(output_file) # Returns at once
 
         # Comment or uncomment this block based on control group of live group
-        sound = AudioSegment.from_file(self.soundDir + 'prompt_3.wav', format='wav')
-        play(sound) # "Remember to think of [PROMPT]"
+        self.play_prompt('prompt_3') # "Remember to think of [PROMPT]"
         self.log_send.emit("Prompt 3")
 
-        sound = AudioSegment.from_file(self.soundDir + 'prompt_4.wav', format='wav')
-        play(sound) # "You can fall back asleep now, hold on to glove again"
+        self.play_prompt('prompt_4') # "You can fall back asleep now, hold on to glove again"
         self.log_send.emit("Prompt 4")
 
         if self.cycle == self.MAX_CYCLE:
-            prompt_final = AudioSegment.from_file(self.soundDir + 'prompt_5.wav', format='wav')
-            play(prompt_final) # "You can wake up fully"
+            self.play_prompt('prompt_5') # "You can wake up fully"
             self.log_send.emit("Wake up")
         self.finished_signal.emit() # Terminate and move to next cycle upon restart
 
-    def record_audio(self, duration, sample_rate=44100):
-        print("Recording...")
-        audio_data = sd.rec(int(duration * sample_rate), 
-                            samplerate=sample_rate, channels=1, dtype='int16')
-        sd.wait()
-        print("Recording complete.")
-        return audio_data.flatten()
+    def play_prompt(self, name):
+        if self.prompt_bank and name in self.prompt_bank.prompts:
+            latency = self.prompt_bank.play(name)
+            self.log_send.emit("Prompt latency {0}: {1:.1f} ms".format(name, latency * 1000))
+        else:   # No output device at startup or prompt missing, decode now
+            play(AudioSegment.from_file(self.soundDir + name + '.wav', format='wav'))
 
-    def save_audio(self, audio_signal, output_file, sample_rate=44100):
-        with wave.open(output_file, 'w') as wf:
+    def record_audio(self, output_file, max_duration, sample_rate=44100):
+        """
+        Streams microphone blocks straight into the WAV file, the header is
+        patched and the file flushed on every block so a crash keeps the answer
+        up to the last block. Ends after SILENCE_DURATION of silence once voice
+        was heard, at most max_duration. Returns the recorded duration (s).
+        """
+        print("Recording...")
+        blocks = queue.Queue()
+        def callback(indata, frames, time_info, status):   # Audio thread
+            blocks.put(indata.copy())
+        block_frames = int(self.BLOCK_DURATION * sample_rate)
+        max_frames = int(max_duration * sample_rate)
+        silence_frames = int(self.SILENCE_DURATION * sample_rate)
+        written = silent = 0
+        heard = False
+        with open(output_file, 'wb') as f, wave.open(f, 'wb') as wf, \
+                sd.InputStream(samplerate=sample_rate, channels=1, dtype='int16',
+                               blocksize=block_frames, callback=callback):
             wf.setnchannels(1)  # Mono audio
             wf.setsampwidth(2)  # 2 bytes per sample for int16 data type
             wf.setframerate(sample_rate)
-            wf.writeframes(audio_signal.tobytes())
+            while written < max_frames:
+                try:
+                    block = blocks.get(timeout=1.0)[:max_frames - written]
+                except queue.Empty:
+                    print("Input device stalled, recording stopped")
+                    break
+                wf.writeframes(block.tobytes())
+                f.flush()
+                written += len(block)
+                if self.is_voice(block):
+                    heard = True
+                    silent = 0
+                else:
+                    silent += len(block)
+                if heard and silent >= silence_frames:
+                    break
+        print("Recording complete.")
+        return written / sample_rate
+
+    def is_voice(self, block):
+        """ Energy based voice activity on one int16 block """
+        rms = np.sqrt(np.mean(np.square(block, dtype=np.float64)))
+        return 20 * np.log10(max(rms, 1.0) / 32768) > self.VAD_THRESHOLD_DB
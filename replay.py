@@ -0,0 +1,158 @@
+"""
+# Headless faster than realtime replay of a session log
+# Runs SignalProcessor (filter, calibration and trigger detection) with its
+# clock driven by the log (timestamps or sample index), no Qt needed.
+# Usage: python replay.py <log> [--clock index|timestamp] [--batch] [--json out.json] [--detector cusum]
+"""
+import sys
+import json
+import argparse
+
+import numpy as np
+
+from PHASES_ENUM import Phases
+import batch
+from detector import add_detector_arguments, detector_config_of
+from processing import SignalProcessor, FILTER_CONFIG, WINDOW_VALUES, CALIBRATION_PERIOD
+from sessionlog import load_session, EVENT_PHASE
+
+SAMPLE_PERIOD = 0.01    # 100 Hz, PlotWindow.stepMS
+# Recorder.run is not replayed, detection is re-armed after its duration
+PROTOCOL_DURATION = 60*3 + 60 + 20  # sleep + recording + prompts (approx.)
+
+class ReplayEngine:
+    def __init__(self, filter_config=None, detector_config=None, window_values=WINDOW_VALUES,
+                 calibration_period=CALIBRATION_PERIOD, protocol_duration=PROTOCOL_DURATION, detector="threshold"):
+        self.filter_config = filter_config or FILTER_CONFIG
+        self.detector_config = detector_config or {}
+        self.window_values = window_values
+        self.CALIBRATION_PERIOD = calibration_period
+        self.PROTOCOL_DURATION = protocol_duration
+        self.detector = detector
+
+    def run(self, values, timestamps):
+        """ Returns dict with detections, phase transitions and per cycle stats """
+        processor = SignalProcessor(window_values=self.window_values, calibration_period=self.CALIBRATION_PERIOD,
+                                    filter_config=self.filter_config, detector_config=self.detector_config,
+                                    detector=self.detector)
+        detector = processor.detector
+        start_time = timestamps[0] if len(timestamps) else 0.0
+        phases = []
+        detections = []
+        cycles = []
+        protocol_end = 0
+        cycle = None
+
+        for value, now in zip(values.tolist(), timestamps.tolist()):
+            if processor.TRIGGERED and now >= protocol_end:
+                processor.now = now
+                processor.rearm()  # Recorder finished_signal, reset_trigger
+                cycle = self._new_cycle(len(cycles), now - start_time + detector.GRACE_WINDOW)
+            was_changing = detector.STATE_CHANGING
+            phase = processor.process(value, now)
+            if phase == Phases.RUNNING:
+                phases.append((now - start_time, phase.name))
+                cycle = self._new_cycle(0, now - start_time)
+            elif phase == Phases.DETECTED:
+                protocol_end = now + self.PROTOCOL_DURATION
+                phases.append((now - start_time, phase.name))
+                detections.append(now - start_time)
+                cycle["detection"] = now - start_time
+                cycle["latency"] = cycle["detection"] - cycle["armed"]
+                cycle["decision_latency"] = processor.decision_latency
+                cycles.append(cycle)
+            elif processor.PHASE != Phases.CALIBRATION and not processor.TRIGGERED and not detector.GRACE:
+                if detector.STATE_CHANGING and not was_changing:
+                    cycle["state_changes"] += 1
+                cycle["peak_avg"] = max(cycle["peak_avg"], processor.avg_last_sec)
+
+        if cycle is not None and not processor.TRIGGERED:
+            cycles.append(cycle)    # Last cycle without detection
+        return {
+                "samples": len(values),
+                "duration": (timestamps[-1] - start_time) if len(timestamps) else 0.0,
+                "calibration_avg": processor.calibration_avg,
+                "threshold": processor.calibration_avg * (1 + detector.DELTA_PERCENT),
+                "phases": phases,
+                "detections": detections,
+                "cycles": cycles,
+                }
+
+    @staticmethod
+    def _new_cycle(number, armed):
+        return {"cycle": number, "armed": armed, "detection": None, "latency": None, "decision_latency": None,
+                "state_changes": 0, "peak_avg": 0.0}
+
+#----------------------------------------
+def replay_file(path, clock="timestamp", sample_period=SAMPLE_PERIOD, use_batch=False, **engine_config):
+    """ use_batch runs the compiled batch kernels, detections only (no cycle stats) """
+    timestamps, values, events = load_session(path, sample_period)
+    if clock == "index":
+        timestamps = np.arange(len(values)) * sample_period
+    if use_batch:
+        if engine_config.get("detector", "threshold") != "threshold":
+            raise ValueError("Batch kernels only implement the threshold detector")
+        result = batch.run_session(values, timestamps, engine_config.get("filter_config") or FILTER_CONFIG,
+                                   engine_config.get("detector_config"),
+                                   engine_config.get("window_values", WINDOW_VALUES),
+                                   engine_config.get("calibration_period", CALIBRATION_PERIOD),
+                                   engine_config.get("protocol_duration", PROTOCOL_DURATION))
+    else:
+        result = ReplayEngine(**engine_config).run(values, timestamps)
+    start_time = timestamps[0] if len(timestamps) else 0.0
+    result["logged_phases"] = [(t - start_time, payload) for t, _, kind, payload in events
+                               if kind == EVENT_PHASE]
+    return result
+
+def print_batch_result(path, result):
+    print("Batch replay of {0}: {1} samples".format(path, result["samples"]))
+    print("Calibration average {0:.4f}".format(result["calibration_avg"]))
+    for cycle, t in enumerate(result["detections"]):
+        print("Cycle {0}: detected at {1:.1f} s, {2} state changes".format(cycle, t, result["state_changes"][cycle]))
+    logged = [t for t, name in result["logged_phases"] if name == Phases.DETECTED.name]
+    print("Logged detections: {0}".format(["{0:.1f}".format(t) for t in logged]))
+
+def print_result(path, result):
+    print("Replay of {0}: {1} samples, {2:.1f} min".format(path, result["samples"], result["duration"] / 60))
+    print("Calibration average {0:.4f}, threshold {1:.4f}".format(result["calibration_avg"], result["threshold"]))
+    for t, name in result["phases"]:
+        print("  {0:8.1f} s  {1}".format(t, name))
+    for cycle in result["cycles"]:
+        if cycle["detection"] is None:
+            print("Cycle {0}: armed at {1:.1f} s, no detection, {2} state changes, peak {3:.4f}".format(
+                cycle["cycle"], cycle["armed"], cycle["state_changes"], cycle["peak_avg"]))
+        else:
+            decision = cycle["decision_latency"]
+            print("Cycle {0}: armed at {1:.1f} s, detected at {2:.1f} s (+{3:.1f} s), {4} state changes, peak {5:.4f}, "
+                  "{6} the first threshold crossing".format(
+                cycle["cycle"], cycle["armed"], cycle["detection"], cycle["latency"],
+                cycle["state_changes"], cycle["peak_avg"],
+                "before" if decision is None else "{0:.1f} s after".format(decision)))
+    logged = [t for t, name in result["logged_phases"] if name == Phases.DETECTED.name]
+    print("Detections replayed: {0}, logged: {1}".format(
+        ["{0:.1f}".format(t) for t in result["detections"]], ["{0:.1f}".format(t) for t in logged]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless replay of a TDI session log")
+    parser.add_argument("log")
+    parser.add_argument("--clock", choices=["timestamp", "index"], default="timestamp",
+                        help="drive the detector clock from logged timestamps or sample index")
+    parser.add_argument("--period", type=float, default=SAMPLE_PERIOD, help="sample period (s) for index clock")
+    parser.add_argument("--protocol-duration", type=float, default=PROTOCOL_DURATION)
+    parser.add_argument("--batch", action="store_true", help="compiled batch kernels, detections only")
+    parser.add_argument("--json", help="write results to this file")
+    add_detector_arguments(parser)
+    args = parser.parse_args()
+
+    result = replay_file(args.log, args.clock, args.period, args.batch, protocol_duration=args.protocol_duration,
+                         detector=args.detector, detector_config=detector_config_of(args))
+    if args.batch:
+        print_batch_result(args.log, result)
+    else:
+        print_result(args.log, result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+
+if __name__ == '__main__':
+    sys.exit(main())
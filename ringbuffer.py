@@ -0,0 +1,50 @@
+"""
+# Fixed size ring buffer with running sum for the signal window
+"""
+import numpy as np
+
+class RingBuffer:
+    """
+    Preallocated window over the last `size` samples.
+    Values are stored twice (at i and i + size) so the window in
+    chronological order is always one contiguous slice: view() is zero-copy
+    and append() is O(1) whatever the window length.
+    The running sum gives the window mean in O(1), it is re-summed once per
+    full turn of the buffer so float drift can not build up over a night.
+    """
+    def __init__(self, size, fill=0.0, dtype=np.float64):
+        if size <= 0:
+            raise ValueError("RingBuffer size should be > 0")
+        self.size = size
+        self._buffer = np.full(2 * size, fill, dtype=dtype)
+        self._start = 0 # Index of oldest value
+        self._sum = float(fill) * size
+
+    def append(self, value):
+        oldest = self._buffer[self._start]
+        self._buffer[self._start] = value
+        self._buffer[self._start + self.size] = value
+        self._start += 1
+        if self._start == self.size:
+            self._start = 0
+            self._sum = float(np.sum(self._buffer[:self.size])) # Drift reset
+        else:
+            self._sum += value - oldest
+
+    def view(self):
+        """ Window as read-only view, oldest first (no copy) """
+        window = self._buffer[self._start:self._start + self.size]
+        window.flags.writeable = False
+        return window
+
+    def last(self):
+        return self._buffer[self._start + self.size - 1]
+
+    def sum(self):
+        return self._sum
+
+    def mean(self):
+        return self._sum / self.size
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,88 @@
+"""
+# Binary frame protocol between the board (Board/code.py) and DataCollector
+# Frame (11 bytes, little endian):
+#   0xA5 0x5A | seq uint16 | device tick ms uint32 | ADC uint16 | checksum uint8
+# Checksum is the byte sum of seq, tick and ADC fields modulo 256.
+# The tick is supervisor.ticks_ms(), which wraps at 2^29 ms (~6.2 days).
+# Keep in sync with Board/code.py
+"""
+import struct
+
+BAUD_RATE = 230400
+FRAME_SYNC = b'\xa5\x5a'
+FRAME_PAYLOAD = struct.Struct('<HIH')   # seq, tick, adc
+FRAME_SIZE = len(FRAME_SYNC) + FRAME_PAYLOAD.size + 1
+SEQ_MODULO = 1 << 16
+TICK_MODULO = 1 << 29   # supervisor.ticks_ms period
+ADC_RANGE = 65536   # 2^16
+ADC_VOLTAGE = 3.3
+
+def adc_to_voltage(adc):
+    return (adc * ADC_VOLTAGE) / ADC_RANGE
+
+def checksum(payload):
+    return sum(payload) & 0xFF
+
+def encode_frame(seq, tick, adc):
+    payload = FRAME_PAYLOAD.pack(seq % SEQ_MODULO, tick % TICK_MODULO, adc)
+    return FRAME_SYNC + payload + bytes((checksum(payload),))
+
+class FrameDecoder:
+    """
+    Incremental decoder, feed() any chunk of bytes read from serial
+    Resynchronises on the sync word after garbage or a bad checksum,
+    sequence gaps are counted as dropped frames. The device tick is unwrapped
+    into ms since the first frame, a gap long enough for the sequence number
+    to wrap is counted from its duration and the mean frame period.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self.last_seq = None
+        self.last_tick = None
+        self.device_ms = 0
+        self.frame_period = 1.0 # ms, running mean over frames without gap
+        self.frames = 0
+        self.dropped = 0
+        self.bad = 0
+
+    def feed(self, data):
+        """ Returns list of (seq, device_ms, adc) for the complete frames in data """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        position = 0
+        end = len(buffer)
+        while True:
+            position = buffer.find(FRAME_SYNC, position)
+            if position < 0:
+                position = max(end - 1, 0)  # Keep a possible half sync byte
+                break
+            if end - position < FRAME_SIZE:
+                break
+            payload = bytes(buffer[position + 2:position + FRAME_SIZE - 1])
+            if checksum(payload) != buffer[position + FRAME_SIZE - 1]:
+                self.bad += 1
+                position += 1   # False sync inside data, search again
+                continue
+            seq, tick, adc = FRAME_PAYLOAD.unpack(payload)
+            if self.last_seq is not None:
+                elapsed = (tick - self.last_tick) % TICK_MODULO
+                self.device_ms += elapsed
+                self.dropped += self._gap(seq, elapsed)
+            self.last_seq = seq
+            self.last_tick = tick
+            self.frames += 1
+            frames.append((seq, self.device_ms, adc))
+            position += FRAME_SIZE
+        del buffer[:position]
+        return frames
+
+    def _gap(self, seq, elapsed):
+        """ Frames lost before seq, elapsed ms since the previous frame """
+        gap = (seq - self.last_seq - 1) % SEQ_MODULO
+        if gap == 0:
+            self.frame_period += 0.01 * (elapsed - self.frame_period)
+            return 0
+        # Sequence number is exact modulo 2^16, the tick tells how many wraps
+        expected = elapsed / self.frame_period - 1
+        return gap + SEQ_MODULO * max(0, round((expected - gap) / SEQ_MODULO))
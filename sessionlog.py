@@ -0,0 +1,311 @@
+"""
+# Append-only binary session log
+#   <base>.samples : packed (timestamp float64, value float32) records
+#   <base>.events  : one tab separated line per event
+#                    timestamp, sample index, kind, payload
+# Old text logs are parsed once into <log>.values.npy / <log>.events.npy
+# sidecars, later loads are a memory map
+# Usage (convert an old text log): python sessionlog.py <old_log> [<out_base>]
+"""
+import os
+import re
+import sys
+import threading
+
+import numpy as np
+
+SAMPLE_DTYPE = np.dtype([('t', '<f8'), ('v', '<f4')])
+SAMPLES_EXT = ".samples"
+EVENTS_EXT = ".events"
+
+EVENT_PHASE = "PHASE"
+EVENT_CAL_AVG = "CAL_AVG"
+EVENT_TDI = "TDI"       # Recorder.log_send messages
+EVENT_DROPPED = "DROPPED"   # Serial frames lost (total so far)
+EVENT_OVERFLOW = "OVERFLOW" # Samples lost on a full processing queue (total so far)
+EVENT_STATS = "STATS"       # Stage timings since the previous one, JSON (stagestats.StageStats.report)
+EVENT_DETECTOR = "DETECTOR" # Decision of the detector: latency from first threshold crossing, state
+
+VALUES_SIDECAR = ".values.npy"
+EVENTS_SIDECAR = ".events.npy"
+TEXT_CHUNK = 1 << 24    # bytes parsed at once, memory bounded whatever the night length
+# Lines not starting like a number: phases, CAL_AVG, Recorder messages
+_EVENT_LINE = re.compile(rb"^[ \t]*[^\s0-9.+\-][^\n]*\n?", re.M)
+
+class SessionLog:
+    """
+    Samples go into a fixed preallocated block, a writer thread swaps it out
+    and appends it to disk every FLUSH_INTERVAL seconds, so memory stays flat
+    for the whole night and a crash loses at most one interval of data.
+    """
+    FLUSH_INTERVAL = 0.25   # seconds
+    BLOCK_SIZE = 4096       # samples, ~40 s at 100 Hz
+
+    def __init__(self, base, flush_interval=None, block_size=None):
+        self.base = base
+        if flush_interval is not None:
+            self.FLUSH_INTERVAL = flush_interval
+        if block_size is not None:
+            self.BLOCK_SIZE = block_size
+        directory = os.path.dirname(base)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.sample_count = _truncate_torn_tail(base)
+        self._samples_file = open(base + SAMPLES_EXT, "ab")
+        self._events_file = open(base + EVENTS_EXT, "a", encoding="utf-8")
+
+        self._block = np.zeros(self.BLOCK_SIZE, dtype=SAMPLE_DTYPE)
+        self._block_count = 0
+        self._events = []
+        self._lock = threading.Lock()       # Pending data
+        self._io_lock = threading.Lock()    # File writes
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="SessionLogWriter", daemon=True)
+        self._writer.start()
+
+    def append_sample(self, timestamp, value):
+        with self._lock:
+            self._block[self._block_count] = (timestamp, value)
+            self._block_count += 1
+            self.sample_count += 1
+            full = self._block_count == self.BLOCK_SIZE
+        if full:    # Only if the writer fell far behind
+            self.flush()
+
+    def log_event(self, timestamp, kind, payload=""):
+        payload = str(payload).replace("\t", " ").replace("\n", " ")
+        with self._lock:
+            self._events.append(f"{timestamp!r}\t{self.sample_count}\t{kind}\t{payload}\n")
+
+    def flush(self):
+        with self._io_lock:
+            with self._lock:
+                samples = self._block[:self._block_count].tobytes()
+                self._block_count = 0
+                events, self._events = self._events, []
+            if samples:
+                self._samples_file.write(samples)
+                self._samples_file.flush()
+                os.fsync(self._samples_file.fileno())
+            if events:
+                self._events_file.writelines(events)
+                self._events_file.flush()
+                os.fsync(self._events_file.fileno())
+
+    def _run(self):
+        while not self._stop.wait(self.FLUSH_INTERVAL):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._writer.join()
+        self.flush()
+        self._samples_file.close()
+        self._events_file.close()
+
+def _truncate_torn_tail(base):
+    """
+    Cuts a record or event line half written by a crash, so appending on
+    resume stays aligned. Returns the number of whole sample records.
+    """
+    count = 0
+    path = base + SAMPLES_EXT
+    if os.path.exists(path):
+        count = os.path.getsize(path) // SAMPLE_DTYPE.itemsize
+        if os.path.getsize(path) != count * SAMPLE_DTYPE.itemsize:
+            os.truncate(path, count * SAMPLE_DTYPE.itemsize)
+    path = base + EVENTS_EXT
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                f.truncate(f.read().rfind(b"\n") + 1)   # Nothing left if no line ended
+    return count
+
+#----------------------------------------
+def read_samples(base, mmap=False):
+    """ Sample records as structured array, a torn last record is dropped """
+    path = base + SAMPLES_EXT
+    count = os.path.getsize(path) // SAMPLE_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=SAMPLE_DTYPE)
+    if mmap:
+        return np.memmap(path, dtype=SAMPLE_DTYPE, mode='r', shape=(count,))
+    return np.fromfile(path, dtype=SAMPLE_DTYPE, count=count)
+
+def read_events(base):
+    """ List of (timestamp, sample_index, kind, payload) """
+    events = []
+    with open(base + EVENTS_EXT, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t", 3)
+            if len(fields) != 4:
+                continue    # Torn last line after a crash
+            timestamp, index, kind, payload = fields
+            events.append((float(timestamp), int(index), kind, payload))
+    return events
+
+def is_session_log(base):
+    return os.path.exists(base + SAMPLES_EXT)
+
+def parse_text_line(line):
+    """
+    Classify one line of the old text LOGS format
+    Returns (kind, payload) with kind None for a sample, or None for blank
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return None, float(line)
+    except ValueError:
+        pass
+    if line.startswith("Phases."):
+        return EVENT_PHASE, line[len("Phases."):]
+    if line.startswith("CAL_AVG:"):
+        return EVENT_CAL_AVG, line[len("CAL_AVG:"):].strip()
+    return EVENT_TDI, line
+
+def convert_text_log(path, base=None, sample_period=0.01):
+    """
+    Convert an old text log (one float per sample, phases and messages
+    interleaved) to the binary format. The old format has no timestamps,
+    samples are assumed evenly spaced by sample_period seconds.
+    """
+    base = base or path
+    if is_session_log(base):
+        raise FileExistsError(base + SAMPLES_EXT)
+    log = SessionLog(base)
+    count = 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = parse_text_line(line)
+                if entry is None:
+                    continue
+                kind, payload = entry
+                if kind is None:
+                    log.append_sample(count * sample_period, payload)
+                    count += 1
+                else:
+                    log.log_event(count * sample_period, kind, payload)
+    finally:
+        log.close()
+    return base
+
+def _parse_lines(text, parts, events, count):
+    """ Line by line, any mix of samples and events """
+    samples = []
+    for line in text.decode("utf-8", "replace").splitlines():
+        entry = parse_text_line(line)
+        if entry is None:
+            continue
+        kind, payload = entry
+        if kind is None:
+            samples.append(payload)
+        else:
+            events.append((count + len(samples), kind, payload))
+    if samples:
+        parts.append(np.array(samples, dtype=np.float64))
+    return count + len(samples)
+
+def _parse_samples(segment, parts, events, count):
+    """ A run of sample lines in one NumPy conversion, line by line if it is not one """
+    lines = segment.split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+    if not lines:
+        return count
+    try:    # Fails on a blank or any non numeric line
+        parts.append(np.fromiter(map(float, lines), dtype=np.float64, count=len(lines)))
+        return count + len(lines)
+    except ValueError:
+        return _parse_lines(segment, parts, events, count)
+
+def parse_text_log(path, chunk_size=TEXT_CHUNK):
+    """
+    Old text log read in chunks, same result as parse_text_line on every line
+    Returns (values float64 array, events [(sample_index, kind, payload)])
+    """
+    parts = []
+    events = []
+    count = 0
+    rest = b""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            chunk = rest + data
+            if data:    # Keep the last partial line for the next chunk
+                cut = chunk.rfind(b"\n") + 1
+                chunk, rest = chunk[:cut], chunk[cut:]
+            position = 0
+            for match in _EVENT_LINE.finditer(chunk):
+                count = _parse_samples(chunk[position:match.start()], parts, events, count)
+                count = _parse_lines(match.group(), parts, events, count)
+                position = match.end()
+            count = _parse_samples(chunk[position:], parts, events, count)
+            if not data:
+                break
+    values = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float64)
+    return values, events
+
+def is_sidecar(path):
+    return path.endswith((VALUES_SIDECAR, EVENTS_SIDECAR))
+
+def _fresh(sidecar, source):
+    return os.path.exists(sidecar) and os.stat(sidecar).st_mtime_ns >= os.stat(source).st_mtime_ns
+
+def _save_atomic(path, array):
+    temp_file = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(temp_file, "wb") as f:
+        np.save(f, array)
+    os.replace(temp_file, path)
+
+def load_text_log(path, cache=True, mmap=False):
+    """
+    parse_text_log through the .npy sidecars, rebuilt when the log is newer
+    mmap: values memory mapped from the sidecar (read-only, zero copy)
+    """
+    values_file, events_file = path + VALUES_SIDECAR, path + EVENTS_SIDECAR
+    if cache and _fresh(values_file, path) and _fresh(events_file, path):
+        table = np.load(events_file)
+        events = [(int(index), str(kind), str(payload)) for index, kind, payload in table]
+        return np.load(values_file, mmap_mode='r' if mmap else None), events
+    values, events = parse_text_log(path)
+    if cache:
+        width = max([len(payload) for _, _, payload in events] + [1])
+        table = np.array([(index, kind, str(payload)) for index, kind, payload in events],
+                         dtype=[('index', '<i8'), ('kind', 'U16'), ('payload', 'U{0}'.format(width))])
+        try:
+            _save_atomic(events_file, table)
+            _save_atomic(values_file, values)
+        except OSError:
+            pass    # Read-only folder, parsed again next time
+    return values, events
+
+def load_session(path, sample_period=0.01, mmap=False, cache=True):
+    """
+    Load a binary session log or an old text log
+    Returns (timestamps, values, events), events as in read_events.
+    Text logs have no timestamps, they are rebuilt from sample_period.
+    mmap: values of a text log (sidecar) are a read-only memory map
+    """
+    if is_session_log(path):
+        samples = read_samples(path)
+        return samples['t'].astype(np.float64), samples['v'].astype(np.float64), read_events(path)
+    values, events = load_text_log(path, cache, mmap)
+    events = [(index * sample_period, index, kind, payload) for index, kind, payload in events]
+    return np.arange(len(values)) * sample_period, values, events
+
+#----------------------------------------
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python sessionlog.py <old_log> [<out_base>]")
+        sys.exit(1)
+    out_base = sys.argv[2] if len(sys.argv) > 2 else None
+    base = convert_text_log(sys.argv[1], out_base)
+    print("Written {0}{1} and {0}{2}".format(base, SAMPLES_EXT, EVENTS_EXT))
+
+if __name__ == '__main__':
+    main()
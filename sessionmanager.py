@@ -0,0 +1,167 @@
+"""
+# Several participants in one process: one TDIEngine per connected board, each
+# with its own filter, detector, protocol, log (LOGS/<participant>_<date>) and
+# recordings (REC/<participant>_<date>...). One processing thread and one
+# post-processing pool serve every participant.
+# Usage: python sessionmanager.py [<debug_level>] [--participants A,B,...]
+#        [--count N] [--replay LOG ...] [--output-devices 3,4] [--headless] [--start-now]
+#        [--detector threshold|cusum] [--resume [CHECKPOINT ...]]
+"""
+from startup import Prewarm, timer as startup_timer # First, starts the startup clock
+import os
+import sys
+import signal
+import argparse
+
+from PyQt5.QtCore import QTimer
+
+from DEBUG_ENUM import DebugLevel
+from PHASES_ENUM import Phases
+from engine import TDIEngine, detect_ttys
+from detector import add_detector_arguments, detector_config_of
+from checkpoint import latest_checkpoint, load_checkpoint
+from postprocess import PostProcessor
+from processingthread import SharedProcessingThread
+
+class SessionManager:
+    """
+    Live: one engine per /dev/ttyACM* (or the given ports).
+    DUMMY/REPLAY: `count` engines, or one per replay file.
+    Participants sharing an output device share its prompt bank (played in turn).
+    resume: one checkpoint per engine (None: new session for that one).
+    """
+    def __init__(self, debug_level=DebugLevel.NORMAL, participants=None, ports=None, replay_files=None,
+                 count=None, is_live=True, keep_history=False, output_devices=None,
+                 detector="threshold", detector_config=None, resume=None):
+        if debug_level >= DebugLevel.DUMMY:
+            n_engines = count or len(replay_files or []) or len(participants or []) or len(resume or []) or 1
+            ports = [None] * n_engines
+        else:
+            ports = ports or detect_ttys()
+            if not ports:
+                raise RuntimeError("No tty available !")
+        if not participants:    # Names of the resumed sessions, else P1, P2...
+            resumed = [load_checkpoint(path)["participant"] if path else None
+                       for path in (resume or [])] + [None] * len(ports)
+            participants = [resumed[index] or "P{0}".format(index + 1) for index in range(len(ports))]
+        if len(participants) < len(ports):
+            raise ValueError("{0} boards but {1} participants".format(len(ports), len(participants)))
+
+        self.postprocessor = PostProcessor(workers=min(len(ports), os.cpu_count() or 1))
+        self.processing = SharedProcessingThread()
+        self.prompt_banks = {}  # Output device: Prewarm of its PromptBank, imports only in DUMMY/REPLAY
+        self.engines = []
+        for index, port in enumerate(ports):
+            device = output_devices[index] if output_devices else None
+            if device not in self.prompt_banks:  # Warmed up during the device check
+                self.prompt_banks[device] = Prewarm(device, label="device {0}".format(device),
+                                                    devices=debug_level < DebugLevel.DUMMY)
+                self.prompt_banks[device].start()
+            replay_file = replay_files[index] if replay_files and index < len(replay_files) else None
+            engine = TDIEngine(debug_level, replay_file, is_live, keep_history=keep_history,
+                               port=port, participant=participants[index],
+                               postprocessor=self.postprocessor,
+                               prompt_bank=self.prompt_banks[device], processing=self.processing,
+                               detector=detector, detector_config=detector_config,
+                               resume=resume[index] if resume and index < len(resume) else None)
+            self.engines.append(engine)
+
+    def describe(self):
+        for engine in self.engines:
+            print("{0}: {1} -> {2}".format(engine.PARTICIPANT, engine.port or "no board", engine.LOG_FILE))
+
+    def start(self):
+        self.processing.start()
+        for engine in self.engines:
+            engine.start()
+
+    def stop(self):
+        # Acquisition first, then processing, logs closed once nothing writes to them
+        for engine in self.engines:
+            engine.data_collector.stop()
+        for engine in self.engines:
+            engine.data_collector.wait()
+        self.processing.stop()
+        self.processing.wait()
+        for engine in self.engines:
+            engine.stop()
+        print("Waiting for recording post-processing")
+        self.postprocessor.shutdown()
+        for prewarm in self.prompt_banks.values():
+            TDIEngine.close_prompt_bank(prewarm.prompt_bank() if prewarm else None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi participant TDI session")
+    parser.add_argument("debug_level", nargs="?", type=int, default=DebugLevel.NORMAL)
+    parser.add_argument("--participants", help="comma separated names, in port order")
+    parser.add_argument("--ports", help="comma separated serial ports, default every /dev/ttyACM*")
+    parser.add_argument("--count", type=int, help="DUMMY/REPLAY: number of participants")
+    parser.add_argument("--replay", nargs="+", default=[], help="REPLAY: one log per participant")
+    parser.add_argument("--output-devices", help="comma separated sounddevice output per participant")
+    parser.add_argument("--headless", action="store_true", help="no tiled view")
+    parser.add_argument("--start-now", action="store_true", help="do not wait for the device check")
+    parser.add_argument("--dry-run", action="store_true", help="no detection")
+    add_detector_arguments(parser)
+    parser.add_argument("--resume", nargs="*",
+                        help="checkpoints in participant order, none: latest interrupted one per participant")
+    args = parser.parse_args()
+
+    replay_files = [file if file.startswith("LOGS/") else "LOGS/" + file for file in args.replay]
+    participants = args.participants.split(",") if args.participants else None
+    resume = args.resume
+    if resume == []:    # Bare --resume
+        if not participants:
+            print("--resume without checkpoints needs --participants")
+            return 1
+        resume = [latest_checkpoint(participant=participant) for participant in participants]
+        for participant, checkpoint in zip(participants, resume):
+            print("{0}: {1}".format(participant, "resuming " + checkpoint if checkpoint else "new session"))
+    output_devices = [int(device) for device in args.output_devices.split(",")] if args.output_devices else None
+    startup_timer.mark("imports")
+    if args.headless:   # No widget or plotting import
+        from PyQt5.QtCore import QCoreApplication
+        app = QCoreApplication(sys.argv)
+    else:
+        from PyQt5.QtWidgets import QApplication
+        app = QApplication(sys.argv)
+    manager = SessionManager(args.debug_level, participants,
+                             args.ports.split(",") if args.ports else None,
+                             replay_files, args.count, not args.dry_run,
+                             keep_history=not args.headless, output_devices=output_devices,
+                             detector=args.detector, detector_config=detector_config_of(args), resume=resume)
+    manager.describe()
+    for engine in manager.engines:
+        engine.phase_changed.connect(lambda phase, name=engine.PARTICIPANT:
+                                     print("{0}: {1}".format(name, Phases(phase).name)))
+
+    stopped = []
+    def shutdown(*_):
+        if not stopped:
+            stopped.append(True)
+            manager.stop()
+        app.quit()
+    if args.headless:
+        if not args.start_now and not resume:
+            input("Press Enter when ready !")  # Audio warms up meanwhile
+        startup_timer.mark("user ready")
+        manager.start()
+    else:
+        from viewer import TiledWindow
+        window = TiledWindow(manager, on_close=shutdown)
+        if not args.start_now and not resume:    # Never wake a resumed participant
+            window.waitForUser()
+        startup_timer.mark("user ready")
+        manager.start()
+        window.show()
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    # Qt blocks Python signal handlers while idle, wake the interpreter regularly
+    wakeup = QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(200)
+    app.exec_()
+    if not stopped:
+        manager.stop()
+
+if __name__ == '__main__':
+    sys.exit(main())
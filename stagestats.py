@@ -0,0 +1,143 @@
+"""
+# Per stage timing of a live session: rolling latency histograms, tick jitter,
+# missed ticks and backlogs, cheap enough for every sample (no Qt dependency)
+# Stages are recorded by the thread running them (acquisition, processing, GUI),
+# report() is called periodically by the engine, summary() by the overlay.
+"""
+import bisect
+import threading
+import time
+
+# Log spaced histogram edges, 1 us to 10 s, 20 per decade (12 % wide bins)
+BINS_PER_DECADE = 20
+EDGES = [10 ** (exponent / BINS_PER_DECADE) for exponent in range(-6 * BINS_PER_DECADE, BINS_PER_DECADE + 1)]
+MIDDLE = 10 ** (0.5 / BINS_PER_DECADE)  # Geometric middle of a bin over its lower edge
+
+class LatencyHistogram:
+    """ Durations (s) since the last reset, O(log bins) per record """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """ Middle of the bin holding the q-th percentile, never above the max """
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                if index == 0 or index == len(EDGES):
+                    return self.max if index else EDGES[0]
+                return min(EDGES[index - 1] * MIDDLE, self.max)
+        return self.max
+
+    def summary(self):
+        # 4 significant digits, beyond the bin resolution anyway, keeps log lines short
+        return {"n": self.count, "mean": float("{0:.4g}".format(self.total / self.count if self.count else 0.0)),
+                "p50": float("{0:.4g}".format(self.percentile(50))),
+                "p99": float("{0:.4g}".format(self.percentile(99))), "max": float("{0:.4g}".format(self.max))}
+
+class Ticker:
+    """ Interval between ticks of a periodic loop, ticks missed when late """
+    def __init__(self, period):
+        self.PERIOD = period
+        self.LATE = 1.5 * period
+        self.intervals = LatencyHistogram()
+        self.last = None
+        self.missed = 0
+
+    def tick(self, now):
+        if self.last is not None:
+            interval = now - self.last
+            self.intervals.record(interval)
+            if interval > self.LATE:
+                self.missed += int(interval / self.PERIOD + 0.5) - 1
+        self.last = now
+
+    def reset(self):
+        self.intervals.reset()
+        self.missed = 0
+
+class StageStats:
+    """
+    stats.record("read", seconds)   duration of one run of a stage
+    stats.tick("acquisition")       loop iteration, period given by add_ticker
+    stats.gauge("serial_backlog", bytes_waiting)   maximum since last report
+    Windows restart at every report(), totals are kept for the whole session.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.stages = {}
+        self.tickers = {}
+        self.gauges = {}
+        self.missed_total = {}
+        self._lock = threading.Lock()   # report() vs first record of a new stage
+
+    def add_ticker(self, name, period):
+        with self._lock:
+            self.tickers[name] = Ticker(period)
+            self.missed_total[name] = 0
+
+    def record(self, name, seconds):
+        histogram = self.stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(name, LatencyHistogram())
+        histogram.record(seconds)
+
+    def tick(self, name):
+        self.tickers[name].tick(self.clock())
+
+    def gauge(self, name, value):
+        if value > self.gauges.get(name, 0):
+            self.gauges[name] = value
+
+    def summary(self):
+        """ Current window, {"stages": {name: {...}}, "ticks": {...}, "gauges": {...}} """
+        with self._lock:
+            return {
+                    "stages": {name: histogram.summary() for name, histogram in self.stages.items()},
+                    "ticks": {name: dict(ticker.intervals.summary(), missed=ticker.missed,
+                                         missed_total=self.missed_total[name] + ticker.missed)
+                              for name, ticker in self.tickers.items()},
+                    "gauges": dict(self.gauges),
+                    }
+
+    def report(self):
+        """ summary() then a new window, records racing the reset may be lost """
+        summary = self.summary()
+        with self._lock:
+            for histogram in self.stages.values():
+                histogram.reset()
+            for name, ticker in self.tickers.items():
+                self.missed_total[name] += ticker.missed
+                ticker.reset()
+            self.gauges = {}
+        return summary
+
+def format_summary(summary):
+    """ One line per stage, for the overlay and the console """
+    lines = []
+    for name, ticks in summary["ticks"].items():
+        lines.append("{0} tick p99 {1:.1f} ms, max {2:.1f} ms, missed {3} ({4} total)".format(
+            name, ticks["p99"] * 1000, ticks["max"] * 1000, ticks["missed"], ticks["missed_total"]))
+    for name, stage in summary["stages"].items():
+        lines.append("{0} p50 {1:.0f} us, p99 {2:.0f} us, max {3:.2f} ms".format(
+            name, stage["p50"] * 1e6, stage["p99"] * 1e6, stage["max"] * 1000))
+    for name, value in summary["gauges"].items():
+        lines.append("{0} max {1}".format(name, value))
+    return "\n".join(lines)
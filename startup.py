@@ -0,0 +1,80 @@
+"""
+# Startup timing breakdown and background audio warm up
+# Importing this module first (TDI.py, tdid.py, sessionmanager.py) starts the
+# clock. Audio (sounddevice, pydub, devices, prompt decoding) is prepared in a
+# thread while the user is still on the device check. DUMMY/REPLAY only import
+# the audio stack, so the first detection does not pay for it either.
+"""
+import time
+import importlib
+import threading
+
+PROCESS_START = time.perf_counter()
+
+class StartupTimer:
+    """ Named milestones since process start, the first one of each name counts """
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.marks = {}
+        self.reported = False
+        self._lock = threading.Lock()   # Marks come from the prewarm and acquisition threads too
+
+    def mark(self, name, wall_time=None):
+        """ wall_time: time.time() of a past milestone, else now """
+        now = time.perf_counter()
+        if wall_time is not None:
+            now -= time.time() - wall_time
+        with self._lock:
+            self.marks.setdefault(name, now - self.start)
+
+    def claim_report(self):
+        """ True once, several engines may finish starting """
+        with self._lock:
+            claimed, self.reported = self.reported, True
+        return not claimed
+
+    def report(self):
+        with self._lock:
+            marks = sorted(self.marks.items(), key=lambda mark: mark[1])
+        return "Startup:\n" + "\n".join("  {0:32} {1:8.1f} ms".format(name, seconds * 1000)
+                                        for name, seconds in marks)
+
+timer = StartupTimer()
+
+class Prewarm(threading.Thread):
+    """
+    Imports the audio stack, opens the input device settings and decodes the
+    prompts on an open output stream (PromptBank) in the background.
+    prompt_bank() waits for it, None when no output device is usable.
+    devices: False imports only, no device opened (DUMMY/REPLAY).
+    """
+    def __init__(self, device=None, label="", devices=True):
+        super().__init__(name="Prewarm", daemon=True)
+        self.device = device
+        self.label = label + " " if label else ""
+        self.devices = devices
+        self._prompt_bank = None
+
+    def run(self):
+        try:
+            import sounddevice as sd
+            importlib.import_module("recorder")   # pydub and the Recorder, nothing left to import at the first detection
+            timer.mark(self.label + "audio imported")
+            if not self.devices:
+                return
+            sd.check_input_settings(channels=1, samplerate=44100)   # Recorder.record_audio settings
+            timer.mark(self.label + "input device checked")
+        except Exception as error:  # No microphone yet, the Recorder reports it on use
+            print("Audio input unavailable ({0})".format(error))
+            if not self.devices:
+                return
+        try:    # Decoded once for the whole night
+            from promptbank import PromptBank
+            self._prompt_bank = PromptBank(device=self.device)
+            timer.mark(self.label + "prompts ready")
+        except Exception as error:  # No output device: Recorder decodes per prompt
+            print("Prompt bank unavailable ({0}), prompts decoded on demand".format(error))
+
+    def prompt_bank(self):
+        self.join()
+        return self._prompt_bank
@@ -0,0 +1,72 @@
+"""
+# Headless TDI daemon, runs a TDIEngine session without widgets or display
+# Usage: python tdid.py [<debug_level> [<replay_file>]] [--start-now] [--dry-run] [--detector cusum]
+#        [--resume [CHECKPOINT]]
+# Without --start-now the session starts when Enter is pressed (device check).
+# --resume continues an interrupted session (latest one by default) at once.
+"""
+from startup import timer as startup_timer # First, starts the startup clock
+import sys
+import signal
+import argparse
+
+from PyQt5.QtCore import QCoreApplication, QTimer
+
+from DEBUG_ENUM import DebugLevel
+from PHASES_ENUM import Phases
+from engine import TDIEngine
+from detector import add_detector_arguments, detector_config_of
+from checkpoint import latest_checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless TDI session")
+    parser.add_argument("debug_level", nargs="?", type=int, default=DebugLevel.NORMAL)
+    parser.add_argument("replay_file", nargs="?")
+    parser.add_argument("--start-now", action="store_true", help="do not wait for Enter")
+    parser.add_argument("--dry-run", action="store_true", help="no detection")
+    add_detector_arguments(parser)
+    parser.add_argument("--resume", nargs="?", const="latest",
+                        help="checkpoint or session log to continue, default the latest interrupted one")
+    args = parser.parse_args()
+
+    resume = latest_checkpoint() if args.resume == "latest" else args.resume
+    if args.resume and not resume:
+        print("No interrupted session to resume")
+        return 1
+
+    replay_file = args.replay_file
+    if replay_file and not replay_file.startswith("LOGS/"):
+        replay_file = "LOGS/" + replay_file
+    startup_timer.mark("imports")
+    app = QCoreApplication(sys.argv)
+    engine = TDIEngine(args.debug_level, replay_file, not args.dry_run,
+                       detector=args.detector, detector_config=detector_config_of(args), resume=resume)
+    print("Session log: " + engine.LOG_FILE)
+    if resume:
+        print("Resuming {0} at cycle {1}".format(resume, engine.cycle))
+    elif not args.start_now:
+        input("Press Enter when ready !")  # Audio warms up meanwhile
+    startup_timer.mark("user ready")
+    engine.start()
+    engine.phase_changed.connect(lambda phase: print("Phase: " + Phases(phase).name))
+    engine.cycle_finished.connect(lambda cycle: print("Cycle {0} finished".format(cycle)))
+
+    stopped = []
+    def shutdown(*_):
+        if not stopped:
+            stopped.append(True)
+            engine.stop()
+        app.quit()
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    # Qt blocks Python signal handlers while idle, wake the interpreter regularly
+    wakeup = QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(200)
+    print("Running, Ctrl-C to stop")
+    app.exec_()
+    if not stopped:
+        engine.stop()
+
+if __name__ == '__main__':
+    sys.exit(main())
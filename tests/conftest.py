@@ -0,0 +1,5 @@
+# Modules live at the repository root, next to the entry points
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
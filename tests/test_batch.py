@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from OneEuroFilter import OneEuroFilter
+
+import batch
+from processing import FILTER_CONFIG, WINDOW_VALUES, CALIBRATION_PERIOD
+from replay import ReplayEngine, PROTOCOL_DURATION
+from ringbuffer import RingBuffer
+
+SAMPLE_PERIOD = 0.01
+
+def drowsy_signal(seconds, seed=0):
+    """ Awake baseline, a 200 s plateau every 20 min (over before detection re-arms), sensor noise """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds / SAMPLE_PERIOD)) * SAMPLE_PERIOD
+    phase = t % 1200
+    rise = np.clip((phase - 600) / 30, 0, 1) * (phase < 800) * 0.05
+    return t, 0.55 + rise + rng.normal(0, 0.002, len(t))
+
+def test_one_euro_filter_matches_the_streaming_filter():
+    _, values = drowsy_signal(60)
+    timestamps = 0.001 * np.arange(len(values))
+    streaming = OneEuroFilter(**FILTER_CONFIG)
+    expected = [streaming(value, timestamp) for value, timestamp in zip(values.tolist(), timestamps.tolist())]
+    assert batch.one_euro_filter(values, timestamps, **FILTER_CONFIG) == pytest.approx(expected, abs=1e-12)
+
+def test_one_euro_filter_without_timestamps():
+    _, values = drowsy_signal(10)
+    streaming = OneEuroFilter(**FILTER_CONFIG)
+    expected = [streaming(value) for value in values.tolist()]
+    assert batch.one_euro_filter(values, **FILTER_CONFIG) == pytest.approx(expected, abs=1e-12)
+
+def test_rolling_mean_matches_the_ring_buffer():
+    _, values = drowsy_signal(30)
+    ring = RingBuffer(WINDOW_VALUES)
+    expected = []
+    for value in values.tolist():
+        ring.append(value)
+        expected.append(ring.mean())
+    assert batch.rolling_mean(values, WINDOW_VALUES) == pytest.approx(expected, abs=1e-12)
+
+def test_calibration_average():
+    timestamps = np.arange(10) * 1.0
+    values = np.arange(10) * 0.1
+    end_index, average = batch.calibration_average(values, timestamps, 4)
+    assert end_index == 4
+    assert average == pytest.approx(np.mean(values[:4]))
+    assert batch.calibration_average(values, timestamps, 100) == (10, pytest.approx(np.mean(values)))
+
+def test_batch_detections_match_the_streaming_replay():
+    timestamps, values = drowsy_signal(2 * 1200)
+    streamed = ReplayEngine().run(values, timestamps)
+    batched = batch.run_session(values, timestamps, FILTER_CONFIG, None, WINDOW_VALUES,
+                                CALIBRATION_PERIOD, PROTOCOL_DURATION)
+    assert len(streamed["detections"]) == 2
+    assert batched["detections"] == pytest.approx(streamed["detections"])
+    assert batched["calibration_avg"] == pytest.approx(streamed["calibration_avg"])
+
+def test_detect_rearms_after_the_protocol():
+    # Rise, back to baseline during the protocol, then a second rise
+    timestamps = np.arange(0, 700, 1.0)
+    avg = np.where((timestamps >= 100) & (timestamps < 300), 1.1, 1.0) + np.where(timestamps >= 500, 0.2, 0.0)
+    detections, state_changes = batch.detect(avg, timestamps, 0, 1.0, protocol_duration=200)
+    assert timestamps[detections].tolist() == [110.0, 510.0]
+    assert state_changes.tolist() == [1, 1, 0]
@@ -0,0 +1,79 @@
+import argparse
+
+import pytest
+
+from detector import (ChangePointDetector, ThresholdDetector, make_detector, add_detector_arguments,
+                      detector_config_of)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def run(detector, clock, level, seconds, step=0.01, check_every=1):
+    """ Feeds a constant level, returns the time of the first detection or None """
+    for i in range(int(round(seconds / step))):
+        clock.now += step
+        detector.update(level)
+        if i % check_every == 0 and detector.check(level):
+            return clock.now
+    return None
+
+def armed(detector_class, **config):
+    clock = Clock()
+    detector = detector_class(clock=clock, **config)
+    detector.set_stable_state(1.0)
+    return detector, clock
+
+def test_cusum_ignores_rises_within_the_drift():
+    detector, clock = armed(ChangePointDetector)
+    assert run(detector, clock, 1.015, 600) is None
+    assert detector.statistic == 0.0
+
+def test_cusum_detection_time_follows_the_rise():
+    # S grows by (rise - drift) per second: 0.05 at +7 % takes 1 s
+    detector, clock = armed(ChangePointDetector, threshold=0.05, drift=0.02)
+    assert run(detector, clock, 1.07, 10) == pytest.approx(1.0, abs=0.02)
+    detector, clock = armed(ChangePointDetector, threshold=0.05, drift=0.02)
+    assert run(detector, clock, 1.035, 10) == pytest.approx(3.33, abs=0.02)
+
+def test_cusum_decision_latency_and_description():
+    detector, clock = armed(ChangePointDetector)
+    assert run(detector, clock, 1.05, 10) is not None
+    assert detector.decision_latency() == pytest.approx(clock.now - detector.FIRST_CROSSING)
+    assert set(detector.describe()) == {"cusum", "mean", "std", "slope"}
+    assert detector.describe()["mean"] == pytest.approx(0.05)
+
+def test_cusum_reset_restarts_the_statistic():
+    detector, clock = armed(ChangePointDetector)
+    run(detector, clock, 1.05, 10)
+    detector.reset(1.0)
+    assert detector.statistic == 0.0 and detector.GRACE
+    assert detector.FIRST_CROSSING is None
+
+def test_threshold_detects_a_new_stable_state():
+    detector, clock = armed(ThresholdDetector, stable_window=10)
+    assert run(detector, clock, 1.0, 60, step=1.0) is None
+    assert run(detector, clock, 1.05, 60, step=1.0) == pytest.approx(71.0)
+    assert detector.decision_latency() == pytest.approx(10.0)
+
+def test_state_and_restore():
+    detector, _ = armed(ThresholdDetector)
+    restored = ThresholdDetector()
+    restored.restore(detector.state())
+    assert restored.STABLE_STATE == 1.0
+
+def test_make_detector():
+    assert isinstance(make_detector("cusum", threshold=0.1), ChangePointDetector)
+    assert make_detector("cusum", threshold=0.1).THRESHOLD == 0.1
+    with pytest.raises(ValueError):
+        make_detector("unknown")
+
+def test_detector_config_of_command_line():
+    parser = argparse.ArgumentParser()
+    add_detector_arguments(parser)
+    assert detector_config_of(parser.parse_args([])) == {}
+    args = parser.parse_args(["--detector", "cusum", "--cusum-threshold", "0.1"])
+    assert detector_config_of(args) == {"threshold": 0.1}
@@ -0,0 +1,52 @@
+import numpy as np
+
+from pyramid import MinMaxPyramid, envelope
+
+def filled(n, seed=0, **config):
+    values = np.random.default_rng(seed).normal(size=n)
+    pyramid = MinMaxPyramid(**config)
+    for value in values.tolist():
+        pyramid.append(value)
+    return pyramid, values.astype(np.float32)
+
+def expected_buckets(values, bucket, start, end):
+    first, last = start // bucket, min(-(-end // bucket), len(values) // bucket)
+    blocks = values[:last * bucket].reshape(-1, bucket)[first:last]
+    return np.arange(first, last) * bucket, blocks.min(axis=1), blocks.max(axis=1)
+
+def test_query_matches_min_max_of_each_bucket():
+    pyramid, values = filled(10000, block=10, factor=4, capacity=8)
+    for start, end, max_points in [(0, None, 1000), (0, None, 50), (1234, 5678, 100), (9000, 9999, 1000)]:
+        indices, mins, maxs = pyramid.query(start, end, max_points)
+        level_end = pyramid.count if end is None else end
+        bucket = indices[1] - indices[0]
+        assert len(indices) <= max_points + 1
+        expected = expected_buckets(values, bucket, start, level_end)
+        assert indices.tolist() == expected[0].tolist()
+        assert mins.tolist() == expected[1].tolist()
+        assert maxs.tolist() == expected[2].tolist()
+
+def test_query_picks_the_finest_level_within_max_points():
+    pyramid, _ = filled(10000, block=10, factor=4)
+    indices, _, _ = pyramid.query(0, 10000, 1000)
+    assert indices[1] - indices[0] == 10
+    indices, _, _ = pyramid.query(0, 10000, 999)
+    assert indices[1] - indices[0] == 40
+
+def test_incomplete_block_and_empty_range():
+    pyramid, _ = filled(25, block=10)
+    indices, mins, maxs = pyramid.query()
+    assert indices.tolist() == [0, 10]
+    assert len(pyramid.query(30, 40)[0]) == 0
+    assert len(MinMaxPyramid().query()[0]) == 0
+
+def test_query_returns_copies():
+    pyramid, _ = filled(100, block=10)
+    _, mins, _ = pyramid.query()
+    mins[:] = 100
+    assert pyramid.query()[1].max() < 100
+
+def test_envelope_draws_each_bucket_as_a_segment():
+    x, y = envelope(np.array([0, 10]), np.array([1.0, 2.0]), np.array([3.0, 4.0]))
+    assert x.tolist() == [0, 0, 10, 10]
+    assert y.tolist() == [1.0, 3.0, 2.0, 4.0]
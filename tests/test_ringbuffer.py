@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from ringbuffer import RingBuffer
+
+def test_view_is_the_last_values_oldest_first():
+    ring = RingBuffer(4)
+    for value in range(1, 7):
+        ring.append(value)
+    assert ring.view().tolist() == [3, 4, 5, 6]
+    assert ring.last() == 6
+    assert len(ring) == 4
+
+def test_view_is_read_only():
+    ring = RingBuffer(3)
+    ring.append(1.0)
+    with pytest.raises(ValueError):
+        ring.view()[0] = 2.0
+
+def test_running_sum_matches_the_window_over_several_turns():
+    rng = np.random.default_rng(0)
+    values = rng.normal(0.5, 0.1, 1000)
+    ring = RingBuffer(64, fill=0.25)
+    window = [0.25] * 64
+    for value in values:
+        ring.append(value)
+        window = window[1:] + [value]
+        assert ring.sum() == pytest.approx(sum(window), abs=1e-9)
+    assert ring.mean() == pytest.approx(np.mean(values[-64:]))
+
+def test_running_sum_does_not_drift_over_a_night():
+    # Large then small values: without the per turn re-sum the error would stay
+    ring = RingBuffer(100)
+    for _ in range(100):
+        ring.append(1e12)
+    for _ in range(360000):
+        ring.append(0.1)
+    assert ring.sum() == pytest.approx(10.0, rel=1e-12)
+
+def test_size_must_be_positive():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
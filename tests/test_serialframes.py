@@ -0,0 +1,53 @@
+from serialframes import FrameDecoder, encode_frame, adc_to_voltage, FRAME_SIZE, SEQ_MODULO, TICK_MODULO
+
+def frames(first_seq, first_tick, count, adc=1000):
+    return b"".join(encode_frame(first_seq + i, first_tick + i, adc) for i in range(count))
+
+def test_frames_split_across_reads():
+    data = frames(0, 100, 10)
+    decoder = FrameDecoder()
+    decoded = []
+    for i in range(0, len(data), 4):
+        decoded += decoder.feed(data[i:i + 4])
+    assert [seq for seq, _, _ in decoded] == list(range(10))
+    assert [device_ms for _, device_ms, _ in decoded] == list(range(10))
+    assert decoder.dropped == decoder.bad == 0
+
+def test_resync_after_garbage_and_bad_checksum():
+    good = frames(0, 0, 3)
+    corrupt = bytearray(encode_frame(3, 3, 500))
+    corrupt[-1] ^= 0xFF
+    decoder = FrameDecoder()
+    decoded = decoder.feed(b"\x00\xa5garbage" + good[:FRAME_SIZE] + bytes(corrupt) + good[FRAME_SIZE:])
+    assert [seq for seq, _, _ in decoded] == [0, 1, 2]
+    assert decoder.bad >= 1
+    assert decoder.dropped == 0
+
+def test_sync_word_inside_a_frame_payload():
+    # ADC 0x5aa5 holds the sync bytes, never taken for a frame start
+    decoder = FrameDecoder()
+    decoded = decoder.feed(encode_frame(0, 0, 0x5AA5) + encode_frame(1, 1, 0xA55A))
+    assert [adc for _, _, adc in decoded] == [0x5AA5, 0xA55A]
+
+def test_sequence_gap_counts_dropped_frames():
+    decoder = FrameDecoder()
+    decoder.feed(frames(0, 0, 5) + frames(8, 8, 2))
+    assert decoder.dropped == 3
+
+def test_sequence_and_tick_wrap():
+    decoder = FrameDecoder()
+    decoded = decoder.feed(frames(SEQ_MODULO - 2, TICK_MODULO - 2, 4))
+    assert [seq for seq, _, _ in decoded] == [SEQ_MODULO - 2, SEQ_MODULO - 1, 0, 1]
+    assert [device_ms for _, device_ms, _ in decoded] == [0, 1, 2, 3]
+    assert decoder.dropped == 0
+
+def test_gap_longer_than_the_sequence_counter_uses_the_tick():
+    decoder = FrameDecoder()
+    decoder.feed(frames(0, 0, 2000))    # 1 ms frame period learnt
+    lost = SEQ_MODULO + 500
+    decoder.feed(frames(2000 + lost, 2000 + lost, 1))
+    assert decoder.dropped == lost
+
+def test_adc_to_voltage():
+    assert adc_to_voltage(0) == 0
+    assert adc_to_voltage(32768) == 1.65
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+
+from sessionlog import (SessionLog, read_samples, read_events, load_session, load_text_log,
+                        parse_text_log, SAMPLES_EXT, EVENTS_EXT, VALUES_SIDECAR, EVENTS_SIDECAR,
+                        EVENT_PHASE, EVENT_CAL_AVG, EVENT_TDI)
+
+TEXT_LOG = "Phases.CALIBRATION\n0.5\n0.51\n\n0.52\nCAL_AVG: 0.51\nPhases.RUNNING\n0.6\nRecording started\n0.61\n"
+
+def write_session(base, samples, events=()):
+    log = SessionLog(base)
+    for timestamp, value in samples:
+        log.append_sample(timestamp, value)
+    for timestamp, kind, payload in events:
+        log.log_event(timestamp, kind, payload)
+    log.close()
+
+def test_samples_and_events_round_trip(tmp_path):
+    base = str(tmp_path / "night")
+    write_session(base, [(0.0, 0.5), (0.01, 0.25)], [(0.01, EVENT_PHASE, "RUNNING")])
+    samples = read_samples(base)
+    assert samples['t'].tolist() == [0.0, 0.01]
+    assert samples['v'].tolist() == [0.5, 0.25]
+    assert read_events(base) == [(0.01, 2, EVENT_PHASE, "RUNNING")]
+
+def test_resume_after_torn_tail_stays_aligned(tmp_path):
+    base = str(tmp_path / "night")
+    write_session(base, [(1.0, 0.5)], [(1.0, EVENT_PHASE, "RUNNING")])
+    with open(base + SAMPLES_EXT, "ab") as f:
+        f.write(b"\x01" * 5)    # Half a record
+    with open(base + EVENTS_EXT, "a", encoding="utf-8") as f:
+        f.write("2.0\t1\tTD")   # Half a line
+    log = SessionLog(base)
+    assert log.sample_count == 1
+    log.append_sample(2.0, 0.75)
+    log.log_event(2.0, EVENT_PHASE, "DETECTED")
+    log.close()
+    samples = read_samples(base)
+    assert samples['t'].tolist() == [1.0, 2.0]
+    assert samples['v'].tolist() == [0.5, 0.75]
+    assert read_events(base) == [(1.0, 1, EVENT_PHASE, "RUNNING"), (2.0, 2, EVENT_PHASE, "DETECTED")]
+
+def test_events_without_any_complete_line_are_dropped(tmp_path):
+    base = str(tmp_path / "night")
+    with open(base + EVENTS_EXT, "w", encoding="utf-8") as f:
+        f.write("0.5\t0\tPHA")
+    SessionLog(base).close()
+    assert os.path.getsize(base + EVENTS_EXT) == 0
+
+@pytest.fixture
+def text_log(tmp_path):
+    path = tmp_path / "old.datalog"
+    path.write_text(TEXT_LOG, encoding="utf-8")
+    return str(path)
+
+def test_parse_text_log(text_log):
+    values, events = parse_text_log(text_log)
+    assert values.tolist() == [0.5, 0.51, 0.52, 0.6, 0.61]
+    assert events == [(0, EVENT_PHASE, "CALIBRATION"), (3, EVENT_CAL_AVG, "0.51"),
+                      (3, EVENT_PHASE, "RUNNING"), (4, EVENT_TDI, "Recording started")]
+
+def test_parse_text_log_chunk_boundaries(text_log):
+    expected_values, expected_events = parse_text_log(text_log)
+    for chunk_size in (1, 3, 7, 16):
+        values, events = parse_text_log(text_log, chunk_size=chunk_size)
+        assert values.tolist() == expected_values.tolist()
+        assert events == expected_events
+
+def test_text_log_sidecars_are_reused_then_rebuilt(text_log):
+    values, events = load_text_log(text_log)
+    assert os.path.exists(text_log + VALUES_SIDECAR) and os.path.exists(text_log + EVENTS_SIDECAR)
+    mapped, cached_events = load_text_log(text_log, mmap=True)
+    assert isinstance(mapped, np.memmap)
+    assert mapped.tolist() == values.tolist() and cached_events == events
+    with open(text_log, "a", encoding="utf-8") as f:
+        f.write("0.7\n")
+    stat = os.stat(text_log + VALUES_SIDECAR)
+    os.utime(text_log, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))    # Log newer than its sidecars
+    values, _ = load_text_log(text_log)
+    assert values.tolist()[-1] == 0.7
+
+def test_load_session_rebuilds_text_log_timestamps(text_log):
+    timestamps, values, events = load_session(text_log, sample_period=0.01)
+    assert timestamps.tolist() == pytest.approx([0.0, 0.01, 0.02, 0.03, 0.04])
+    assert events[1] == (pytest.approx(0.03), 3, EVENT_CAL_AVG, "0.51")
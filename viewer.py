@@ -0,0 +1,191 @@
+"""
+# Qt viewer of TDIEngine sessions: one PlotWindow per engine, TiledWindow for
+# a SessionManager. Only imported when a display is used (TDI.py, sessionmanager.py)
+"""
+import math
+from time import perf_counter
+
+import numpy as np
+
+import pyqtgraph as pg
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QGridLayout, QMainWindow, QMessageBox, QVBoxLayout, QWidget
+
+from PHASES_ENUM import Phases
+from pyramid import envelope
+from stagestats import format_summary
+
+class PlotWindow(QMainWindow):
+    """
+    Optional viewer attached to a TDIEngine, the engine runs without it
+    show_stats: stage timings overlay under the average (toggled with S)
+    """
+    def __init__(self, engine, display_fps=30, show_stats=False):
+        super().__init__()
+        self.engine = engine
+        self.processor = engine.processor
+        self.stats = engine.stats
+        self.show_stats = show_stats
+        self.stepMS = engine.stepMS
+        self.DISPLAY_FPS = display_fps   # Repaint rate, independent of sampling
+        self.MAX_DISPLAY_POINTS = 1000
+        self.OVERVIEW_FPS = 1
+        self.N_VALUES = engine.N_VALUES
+        self.display_step = max(1, -(-self.N_VALUES // self.MAX_DISPLAY_POINTS))
+        self.data_x = np.arange(self.N_VALUES)[::self.display_step]
+        self.calibration_line = None
+        self.stats.add_ticker("display", 1 / self.DISPLAY_FPS)
+        self.initUI()
+
+    def waitForUser(self):
+        message = "Press ok when ready !"
+        msg_box = QMessageBox()
+        msg_box.setWindowTitle("User Action - Device check")
+        RICH_TEXT_FORMAT = 1
+        msg_box.setTextFormat(RICH_TEXT_FORMAT)
+        msg_box.setText(message)
+        msg_box.setStandardButtons(QMessageBox.Ok)
+        msg_box.exec_()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Q and event.modifiers() & Qt.ControlModifier:
+            self.close()    # CTRL-Q close shortcut
+        elif event.key() == Qt.Key_S:
+            self.show_stats = not self.show_stats
+            self.stats_text_item.setVisible(self.show_stats)
+            self.update_stats()
+
+    def initUI(self):
+        self.setWindowTitle('Real-time data plot from sensor')
+
+        self.WINDOW_WIDTH = 800
+        self.WINDOW_HEIGHT = 600
+        self.setGeometry(100, 100, self.WINDOW_WIDTH, self.WINDOW_HEIGHT)
+
+        self.PENS = {   # Built once, not per frame
+                Phases.CALIBRATION: pg.mkPen(color='y'),
+                Phases.RUNNING: pg.mkPen(color='r'),
+                Phases.DETECTED: pg.mkPen(color='g'),  # Triggered
+                }
+        self.pen_phase = None
+        self.plot = pg.PlotWidget()
+
+        self.plot.setXRange(0, self.N_VALUES)
+        self.plot.setYRange(0, self.engine.data_collector.max())
+
+        YAXIS = "left"; XAXIS = "bottom"
+        self.plot.setLabel(YAXIS, "Voltage")
+        self.plot.setLabel(XAXIS, "Time (update " + str(self.stepMS) + " ms)")
+        participant = " - " + self.engine.PARTICIPANT if self.engine.PARTICIPANT else ""
+        self.plot.setTitle("Input data - FSR Glove" + participant)
+        self.curve = self.plot.plot(pen=self.PENS[Phases.RUNNING], width=15)
+        self.curve_raw = self.plot.plot(pen=pg.mkPen(color='b'), width=10)
+
+        self.avg_text_item = pg.TextItem("", anchor=(0, 0), color='w', border='b')
+        self.plot.addItem(self.avg_text_item) # anchor not working as expected (MINOR)
+        self.stats_text_item = pg.TextItem("", anchor=(0, 0), color='w', border='b')
+        self.stats_text_item.setPos(0, self.engine.data_collector.max())  # Top left
+        self.stats_text_item.setVisible(self.show_stats)
+        self.plot.addItem(self.stats_text_item)
+
+        # Whole night, drag/zoom to scroll, 'A' button to follow the night again
+        self.overview = pg.PlotWidget()
+        self.overview.setLabel(YAXIS, "Filtered")
+        self.overview.setLabel(XAXIS, "Time since start (min)")
+        self.overview.setTitle("Whole night (min/max envelope)")
+        self.overview_curve = self.overview.plot(pen=self.PENS[Phases.RUNNING])
+        self.overview.sigXRangeChanged.connect(self.update_overview)
+        self.overview_updating = False
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.plot, 2)
+        layout.addWidget(self.overview, 1)
+        container = QWidget()
+        container.setLayout(layout)
+        self.setCentralWidget(container)
+
+        self.plotted_count = -1
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.update_plot)
+        self.timer.start(1000 // self.DISPLAY_FPS)
+        self.overview_timer = QTimer()
+        self.overview_timer.timeout.connect(self.update_overview)
+        self.overview_timer.timeout.connect(self.update_stats)
+        self.overview_timer.start(1000 // self.OVERVIEW_FPS)
+
+    def closeEvent(self, event):
+        print("Window is being closed")
+        self.engine.stop()
+        event.accept()
+
+    def update_plot(self):
+        self.stats.tick("display")
+        if self.processor.total_data_count == self.plotted_count:
+            return  # No new sample, nothing to repaint
+        self.plotted_count = self.processor.total_data_count
+        data_y, data_y_raw, avg_last_sec, PHASE, TRIGGERED = self.processor.snapshot(self.MAX_DISPLAY_POINTS)
+        start = perf_counter()
+        self.curve.setData(self.data_x, data_y)
+        self.curve_raw.setData(self.data_x, data_y_raw)
+        self.stats.record("setData", perf_counter() - start)
+        if avg_last_sec is not None:
+            self.avg_text_item.setText(f"Average: {avg_last_sec:.3f}, AVG_T {np.mean(data_y):.3f}")
+        if PHASE != Phases.CALIBRATION and self.calibration_line is None:
+            self.calibration_line = self.plot.addLine(y=self.processor.calibration_avg, pen=self.PENS[Phases.CALIBRATION])
+            self.overview.addLine(y=self.processor.calibration_avg, pen=self.PENS[Phases.CALIBRATION])
+        pen_phase = Phases.DETECTED if TRIGGERED else min(PHASE, Phases.RUNNING)
+        if pen_phase != self.pen_phase:
+            self.pen_phase = pen_phase
+            self.curve.setPen(self.PENS[pen_phase])
+
+    def update_stats(self):
+        if self.show_stats:  # Current window of the engine stats, logged every STATS_PERIOD
+            self.stats_text_item.setText(format_summary(self.stats.summary()))
+
+    def update_overview(self):
+        if self.overview_updating:
+            return  # setData can change the range and call back
+        history = self.processor.history
+        if history is None:
+            return  # Engine started without keep_history
+        self.overview_updating = True
+        minutes_per_sample = self.stepMS / 60000
+        if self.overview.getViewBox().autoRangeEnabled()[0]:
+            start, end = 0, history.count
+        else:
+            x_min, x_max = self.overview.viewRange()[0]
+            start, end = int(x_min / minutes_per_sample), int(x_max / minutes_per_sample) + 1
+        x, y = envelope(*history.query(start, end, max(self.overview.width(), 100)))
+        self.overview_curve.setData(x * minutes_per_sample, y)
+        self.overview_updating = False
+
+class TiledWindow(QMainWindow):
+    """ One PlotWindow per participant of a SessionManager, in a grid """
+    def __init__(self, manager, on_close=None):
+        super().__init__()
+        self.manager = manager
+        self.on_close = on_close or (lambda: manager.stop())
+        self.setWindowTitle('Real-time data plot from sensors')
+        self.setGeometry(50, 50, 1600, 900)
+        # Total repaint cost stays about one full rate window whatever the count
+        display_fps = max(5, 30 // len(manager.engines))
+        self.panels = [PlotWindow(engine, display_fps) for engine in manager.engines]
+        columns = math.ceil(math.sqrt(len(self.panels)))
+        layout = QGridLayout()
+        for index, panel in enumerate(self.panels):
+            layout.addWidget(panel, index // columns, index % columns)
+        container = QWidget()
+        container.setLayout(layout)
+        self.setCentralWidget(container)
+
+    def waitForUser(self):
+        self.panels[0].waitForUser()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Q and event.modifiers() & Qt.ControlModifier:
+            self.close()    # CTRL-Q close shortcut
+
+    def closeEvent(self, event):
+        print("Window is being closed")
+        self.on_close()
+        event.accept()